@@ -1,10 +1,16 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from werkzeug.exceptions import HTTPException, ServiceUnavailable
+import importlib.metadata
 import logging
 import os
-from datetime import datetime
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timezone
 
 # Import configuration
 from config.settings import config
@@ -12,11 +18,81 @@ from config.settings import config
 # Import utilities
 from utils.database import init_database
 from utils.stream_manager import init_stream_manager
+from utils.rate_limit import BoundedMemoryStorage  # registers the bounded-memory:// scheme
+from utils.json_provider import OrjsonProvider, dumps_bytes
 
-# Import routes
-from routes.overlays import overlays_bp
-from routes.streams import streams_bp
-from routes.health import health_bp
+# Static part of the root payload, pre-serialized around the timestamp field
+ROOT_PREFIX = dumps_bytes({
+    'success': True,
+    'message': 'Livesitter API',
+    'version': '1.0.0',
+    'endpoints': {
+        'overlays': '/api/overlays',
+        'streams': '/api/streams',
+        'health': '/api/health'
+    }
+})[:-1] + b',"timestamp":"'
+ROOT_SUFFIX = b'"}'
+
+# Static API documentation, serialized once at import
+API_DOCS_BYTES = dumps_bytes({
+    'success': True,
+    'message': 'API Documentation',
+    'endpoints': {
+        'overlays': {
+            'GET /api/overlays': 'Get all overlays with pagination',
+            'GET /api/overlays/<id>': 'Get specific overlay',
+            'POST /api/overlays': 'Create new overlay',
+            'PUT /api/overlays/<id>': 'Update overlay',
+            'DELETE /api/overlays/<id>': 'Delete overlay',
+            'POST /api/overlays/batch': 'Create multiple overlays'
+        },
+        'streams': {
+            'GET /api/streams': 'Get all streams with pagination',
+            'GET /api/streams/<id>': 'Get specific stream',
+            'POST /api/streams': 'Create new stream',
+            'PUT /api/streams/<id>': 'Update stream',
+            'DELETE /api/streams/<id>': 'Delete stream',
+            'POST /api/streams/<id>/start': 'Start stream',
+            'POST /api/streams/<id>/stop': 'Stop stream',
+            'GET /api/streams/<id>/status': 'Get stream status',
+            'GET /api/streams/active': 'Get active streams'
+        },
+        'health': {
+            'GET /api/health': 'Overall health check',
+            'GET /api/health/database': 'Database health check',
+            'GET /api/health/streams': 'Streams health check'
+        }
+    }
+})
+
+# Seconds to fail fast after services could not be initialized, instead of
+# every request waiting out another MongoDB server selection timeout
+SERVICE_INIT_RETRY_SECONDS = 5.0
+
+def initialize_services(app: Flask) -> None:
+    """Initialize database and stream manager for app (idempotent)"""
+    services = app.extensions['livesitter']
+    if time.monotonic() - services['failed_at'] < SERVICE_INIT_RETRY_SECONDS:
+        raise ServiceUnavailable("Database unavailable")
+    
+    with services['lock']:
+        if services['ready']:
+            return
+        # Another request may have just failed while this one waited
+        if time.monotonic() - services['failed_at'] < SERVICE_INIT_RETRY_SECONDS:
+            raise ServiceUnavailable("Database unavailable")
+        try:
+            # Get the actual config class instance
+            config_instance = services['config_class']()
+            init_database(app.config)
+            init_stream_manager(config_instance)
+            services['ready'] = True
+            app.logger.info("Successfully initialized database and stream manager")
+        except Exception as e:
+            services['failed_at'] = time.monotonic()
+            app.logger.error(f"Failed to initialize services: {e}")
+            raise ServiceUnavailable("Database unavailable") from e
 
 def create_app(config_name='default'):
     """Create and configure Flask application"""
@@ -27,6 +103,9 @@ def create_app(config_name='default'):
     # Load configuration
     app.config.from_object(config[config_name])
     
+    # Serialize JSON responses with orjson (stdlib json under PyPy)
+    app.json = OrjsonProvider(app)
+    
     # Disable automatic trailing slash redirects to prevent CORS issues
     app.url_map.strict_slashes = False
     
@@ -38,34 +117,53 @@ def create_app(config_name='default'):
     
     # Initialize CORS with comprehensive configuration
     CORS(app, 
-         origins=app.config['CORS_ORIGINS'],
+         origins=list(app.config['CORS_ORIGINS']),
          methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'PATCH'],
          allow_headers=['Content-Type', 'Authorization', 'Accept', 'Origin', 'X-Requested-With'],
          expose_headers=['Content-Type', 'Authorization'],
          supports_credentials=False,  # Changed to False to avoid credential issues
-         max_age=3600)
+         max_age=86400)
+    
+    # Answer preflights before rate limiting, service init and view dispatch;
+    # flask-cors adds the Access-Control-* headers in its after_request hook
+    @app.before_request
+    def short_circuit_preflight():
+        if request.method == 'OPTIONS' and request.routing_exception is None:
+            return app.make_default_options_response()
     
     # Initialize rate limiter
     limiter = Limiter(
         app=app,
         key_func=get_remote_address,
         default_limits=[app.config['RATELIMIT_DEFAULT']],
-        storage_uri=app.config['RATELIMIT_STORAGE_URL']
+        storage_uri=app.config['RATELIMIT_STORAGE_URL'],
+        storage_options={'max_keys': app.config['RATELIMIT_MAX_KEYS']}
     )
     
-    # Initialize database and stream manager
-    with app.app_context():
+    # Database and stream manager are initialized on the first request
+    app.extensions['livesitter'] = {
+        'config_class': config[config_name],
+        'ready': False,
+        'failed_at': float('-inf'),
+        'lock': threading.Lock()
+    }
+    
+    @app.before_request
+    def ensure_services():
+        if app.extensions['livesitter']['ready']:
+            return
         try:
-            # Get the actual config class instance
-            config_instance = config[config_name]()
-            init_database(app.config)
-            init_stream_manager(config_instance)
-            app.logger.info("Successfully initialized database and stream manager")
-        except Exception as e:
-            app.logger.error(f"Failed to initialize services: {e}")
-            raise
+            initialize_services(app)
+        except ServiceUnavailable:
+            # Health checks report the outage themselves with a 503
+            if request.blueprint != 'health':
+                raise
     
     # Register blueprints
+    from routes.overlays import overlays_bp
+    from routes.streams import streams_bp
+    from routes.health import health_bp
+    
     app.register_blueprint(overlays_bp)
     app.register_blueprint(streams_bp)
     app.register_blueprint(health_bp)
@@ -92,102 +190,123 @@ def create_app(config_name='default'):
             'error': 'Internal server error'
         }), 500
     
-    # Request logging middleware
-    @app.before_request
-    def log_request():
-        app.logger.info(f"{request.method} {request.path} - {request.remote_addr}")
-    
-    # Global OPTIONS handler for CORS preflight requests
-    @app.route('/api/<path:path>', methods=['OPTIONS'])
-    def handle_options(path):
-        """Handle OPTIONS requests for all API endpoints"""
-        response = jsonify({'success': True})
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS, PATCH'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Accept, Origin, X-Requested-With'
-        response.headers['Access-Control-Max-Age'] = '3600'
-        return response
+    @app.errorhandler(Exception)
+    def unhandled_exception(error):
+        # Other HTTP errors (e.g. malformed JSON bodies) keep their status code
+        if isinstance(error, HTTPException):
+            return jsonify({
+                'success': False,
+                'error': error.description
+            }), error.code
+        
+        app.logger.exception("Unhandled error in %s %s", request.method, request.path)
+        return jsonify({
+            'success': False,
+            'error': 'Internal server error'
+        }), 500
+    
+    # Request logging middleware (opt-in, it costs two logger calls per request)
+    if app.config.get('REQUEST_LOGGING', False):
+        @app.before_request
+        def log_request():
+            app.logger.info("%s %s - %s", request.method, request.path, request.remote_addr)
+        
+        @app.after_request
+        def log_response(response):
+            if app.logger.isEnabledFor(logging.INFO):
+                app.logger.info("Response: %s", response.status_code)
+            return response
+    
+    # Per-route cache policies; data endpoints keep Flask's default (no Cache-Control)
+    cache_policies = {
+        'root': 'public, max-age=300',
+        'api_docs': 'public, max-age=300',
+    }
     
-    # Response logging middleware
     @app.after_request
-    def log_response(response):
-        app.logger.info(f"Response: {response.status_code}")
+    def set_cache_headers(response):
+        # Let browsers cache preflight responses for the full Max-Age
+        if request.method == 'OPTIONS':
+            if response.status_code < 300:
+                response.headers['Cache-Control'] = 'public, max-age=86400'
+            return response
         
-        # Add cache-busting headers for CORS
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
+        policy = cache_policies.get(request.endpoint)
+        if policy and response.status_code < 300:
+            response.headers['Cache-Control'] = policy
         
         return response
     
 
     
-    # Root endpoint
+    # Root endpoint; only the timestamp changes, refreshed at most once per second
+    root_cache = {'body': b'', 'expires': 0.0}
+    
     @app.route('/')
     def root():
-        return jsonify({
-            'success': True,
-            'message': 'Livesitter API',
-            'version': '1.0.0',
-            'timestamp': datetime.utcnow().isoformat(),
-            'endpoints': {
-                'overlays': '/api/overlays',
-                'streams': '/api/streams',
-                'health': '/api/health'
-            }
-        })
+        now = time.monotonic()
+        if now >= root_cache['expires']:
+            timestamp = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+            root_cache['body'] = ROOT_PREFIX + timestamp.encode() + ROOT_SUFFIX
+            root_cache['expires'] = now + 1.0
+        return Response(root_cache['body'], mimetype='application/json')
     
     # API documentation endpoint
     @app.route('/api/docs')
     def api_docs():
-        return jsonify({
-            'success': True,
-            'message': 'API Documentation',
-            'endpoints': {
-                'overlays': {
-                    'GET /api/overlays': 'Get all overlays with pagination',
-                    'GET /api/overlays/<id>': 'Get specific overlay',
-                    'POST /api/overlays': 'Create new overlay',
-                    'PUT /api/overlays/<id>': 'Update overlay',
-                    'DELETE /api/overlays/<id>': 'Delete overlay',
-                    'POST /api/overlays/batch': 'Create multiple overlays'
-                },
-                'streams': {
-                    'GET /api/streams': 'Get all streams',
-                    'GET /api/streams/<id>': 'Get specific stream',
-                    'POST /api/streams': 'Create new stream',
-                    'PUT /api/streams/<id>': 'Update stream',
-                    'DELETE /api/streams/<id>': 'Delete stream',
-                    'POST /api/streams/<id>/start': 'Start stream',
-                    'POST /api/streams/<id>/stop': 'Stop stream',
-                    'GET /api/streams/<id>/status': 'Get stream status',
-                    'GET /api/streams/active': 'Get active streams'
-                },
-                'health': {
-                    'GET /api/health': 'Overall health check',
-                    'GET /api/health/database': 'Database health check',
-                    'GET /api/health/streams': 'Streams health check'
-                }
-            }
-        })
+        return Response(API_DOCS_BYTES, mimetype='application/json')
     
     return app
 
+def check_werkzeug_version() -> None:
+    """Refuse to run the dev server on Werkzeug 2.3.x, which has a large throughput regression"""
+    version = importlib.metadata.version('werkzeug')
+    if tuple(version.split('.')[:2]) == ('2', '3'):
+        raise RuntimeError(f"Werkzeug {version} is not supported, install Werkzeug>=3.0")
+
+def exit_on_sigterm() -> None:
+    """Turn SIGTERM into a normal exit so atexit hooks (stopping FFmpeg) run"""
+    # Only raises SystemExit; the actual shutdown happens outside the handler
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
+def exec_gunicorn(config_name: str, host: str, port: int) -> None:
+    """Replace the current process with gunicorn running gevent workers"""
+    # Active streams, rate limits and the overlay cache live in-process, so a
+    # single worker is the default; concurrency comes from gevent connections
+    workers = os.environ.get('WEB_CONCURRENCY', '1')
+    os.execvp('gunicorn', [
+        'gunicorn',
+        '-k', 'gevent',
+        '--worker-connections', os.environ.get('GUNICORN_WORKER_CONNECTIONS', '1000'),
+        '-w', workers,
+        '-b', f'{host}:{port}',
+        # Stops each worker's FFmpeg processes when it exits
+        '-c', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py'),
+        f"app:create_app('{config_name}')"
+    ])
+
 def main():
     """Main application entry point"""
     # Get configuration from environment
     config_name = os.environ.get('FLASK_ENV', 'development')
     
-    # Create app
-    app = create_app(config_name)
-    
-    # Run app
     host = os.environ.get('FLASK_HOST', '0.0.0.0')
     port = int(os.environ.get('FLASK_PORT', 5000))
     debug = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
     
+    # The Werkzeug dev server is for development only; hand everything else to gunicorn
+    if config_name != 'development':
+        exec_gunicorn(config_name, host, port)
+    
+    check_werkzeug_version()
+    
+    # Create app
+    app = create_app(config_name)
+    
+    app.logger.warning("Running on the Werkzeug development server; use gunicorn for performance testing")
     app.logger.info(f"Starting Livesitter API on {host}:{port}")
+    exit_on_sigterm()
     app.run(host=host, port=port, debug=debug)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
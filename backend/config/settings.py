@@ -2,34 +2,67 @@ import os
 from dotenv import load_dotenv
 
 load_dotenv()
-print("Loaded MONGODB_URI:", os.environ.get('MONGODB_URI'))
+
+# Environment snapshot taken once, after .env has been loaded
+_env = dict(os.environ)
 
 class Config:
     """Base configuration class"""
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here'
-    MONGODB_URI = os.environ.get('MONGODB_URI') or 'mongodb://localhost:27017/livesitter'
-    DATABASE_NAME = os.environ.get('DATABASE_NAME') or 'livesitter'
+    SECRET_KEY = _env.get('SECRET_KEY', 'your-secret-key-here')
+    MONGODB_URI = _env.get('MONGODB_URI', 'mongodb://localhost:27017/livesitter')
+    DATABASE_NAME = _env.get('DATABASE_NAME', 'livesitter')
+    
+    # MongoDB client timeouts (ms) and connection pool sizing
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(_env.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    MONGO_CONNECT_TIMEOUT_MS = int(_env.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+    MONGO_SOCKET_TIMEOUT_MS = int(_env.get('MONGO_SOCKET_TIMEOUT_MS', '30000'))
+    MONGO_MAX_POOL_SIZE = int(_env.get('MONGO_MAX_POOL_SIZE', '50'))
+    MONGO_MIN_POOL_SIZE = int(_env.get('MONGO_MIN_POOL_SIZE', '2'))
     
     # RTSP Stream settings
-    FFMPEG_PATH = os.environ.get('FFMPEG_PATH') or 'ffmpeg'
-    HLS_SEGMENT_DURATION = int(os.environ.get('HLS_SEGMENT_DURATION', '2'))
-    HLS_PLAYLIST_LENGTH = int(os.environ.get('HLS_PLAYLIST_LENGTH', '10'))
+    FFMPEG_PATH = _env.get('FFMPEG_PATH', 'ffmpeg')
+    FFPROBE_PATH = _env.get('FFPROBE_PATH', 'ffprobe')
+    # RTSP transport for FFmpeg/ffprobe; tcp avoids UDP packet loss, empty keeps FFmpeg's default
+    RTSP_TRANSPORT = _env.get('RTSP_TRANSPORT', 'tcp')
+    # 'auto' uses a detected hardware encoder (NVENC, then VAAPI), 'none' always encodes with libx264
+    FFMPEG_HWACCEL = _env.get('FFMPEG_HWACCEL', 'auto').lower()
+    FFMPEG_VAAPI_DEVICE = _env.get('FFMPEG_VAAPI_DEVICE', '/dev/dri/renderD128')
+    # Software encoder speed/efficiency trade-off; ultrafast costs far more bandwidth
+    LIBX264_PRESET = _env.get('LIBX264_PRESET', 'veryfast')
+    # libx264 threads per stream (each stream is pinned to that many cores, 0 disables) and FFmpeg nice level
+    FFMPEG_THREADS = int(_env.get('FFMPEG_THREADS', '2'))
+    FFMPEG_NICE = int(_env.get('FFMPEG_NICE', '10'))
+    HLS_SEGMENT_DURATION = int(_env.get('HLS_SEGMENT_DURATION', '2'))
+    HLS_PLAYLIST_LENGTH = int(_env.get('HLS_PLAYLIST_LENGTH', '10'))
+    # Where FFmpeg writes playlists/segments; a tmpfs path avoids disk churn from segment rotation
+    STREAMS_DIR = _env.get('STREAMS_DIR') or os.path.join(os.getcwd(), 'streams')
+    # Internal nginx location for X-Accel-Redirect; empty serves HLS files from Flask
+    HLS_ACCEL_REDIRECT = _env.get('HLS_ACCEL_REDIRECT', '')
     
     # CORS settings
-    CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:8080,http://localhost:3000,http://localhost:5173').split(',')
+    CORS_ORIGINS = frozenset(
+        origin.strip()
+        for origin in _env.get('CORS_ORIGINS', 'http://localhost:8080,http://localhost:3000,http://localhost:5173').split(',')
+        if origin.strip()
+    )
     
     # Rate limiting
     RATELIMIT_DEFAULT = "100 per minute"
-    RATELIMIT_STORAGE_URL = "memory://"
+    RATELIMIT_STORAGE_URL = "bounded-memory://"
+    RATELIMIT_MAX_KEYS = int(_env.get('RATELIMIT_MAX_KEYS', '16384'))
     
     # Stream settings
-    STREAM_TIMEOUT = int(os.environ.get('STREAM_TIMEOUT', '30'))
-    MAX_STREAMS = int(os.environ.get('MAX_STREAMS', '5'))
+    STREAM_TIMEOUT = int(_env.get('STREAM_TIMEOUT', '30'))
+    MAX_STREAMS = int(_env.get('MAX_STREAMS', '5'))
+    
+    # Per-request access logging
+    REQUEST_LOGGING = _env.get('REQUEST_LOGGING', 'False').lower() == 'true'
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     TESTING = False
+    REQUEST_LOGGING = _env.get('REQUEST_LOGGING', 'True').lower() == 'true'
 
 class ProductionConfig(Config):
     """Production configuration"""
@@ -41,6 +74,10 @@ class TestingConfig(Config):
     TESTING = True
     DEBUG = True
     MONGODB_URI = 'mongodb://localhost:27017/livesitter_test'
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(_env.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '3000'))
+    MONGO_CONNECT_TIMEOUT_MS = int(_env.get('MONGO_CONNECT_TIMEOUT_MS', '3000'))
+    MONGO_SOCKET_TIMEOUT_MS = int(_env.get('MONGO_SOCKET_TIMEOUT_MS', '10000'))
+    MONGO_MAX_POOL_SIZE = int(_env.get('MONGO_MAX_POOL_SIZE', '20'))
 
 config = {
     'development': DevelopmentConfig,
@@ -0,0 +1,6 @@
+"""Gunicorn settings used by exec_gunicorn"""
+
+def worker_exit(server, worker):
+    """Stop this worker's FFmpeg processes once it has left its request loop"""
+    from utils.stream_manager import shutdown_stream_manager
+    shutdown_stream_manager()
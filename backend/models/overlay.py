@@ -1,11 +1,27 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, Any, Optional
 from bson import ObjectId
 import re
 
+def _now() -> datetime:
+    """Current UTC time as a naive datetime (replacement for datetime.utcnow)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+_HEX_COLOR_RE = re.compile(r'^#(?:[A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$')
+_OVERLAY_TYPES = frozenset(('text', 'image', 'logo'))
+
 class Overlay:
     """Overlay model for MongoDB"""
     
+    __slots__ = ('_id', 'user_id', 'name', 'type', 'content', 'position', 'size', 'style',
+                 'created_at', 'updated_at')
+    
+    # Fields replaced wholesale by update(); style is merged instead
+    _UPDATABLE = ('name', 'type', 'content', 'position', 'size')
+    
+    # Document keys that doc_to_dict can return as-is
+    _FIELDS = frozenset(__slots__)
+    
     def __init__(self, data: Dict[str, Any]):
         self._id = data.get('_id')
         self.user_id = data.get('user_id', 'default')
@@ -23,8 +39,9 @@ class Overlay:
             'borderColor': 'transparent',
             'borderWidth': 0
         })
-        self.created_at = data.get('created_at', datetime.utcnow())
-        self.updated_at = data.get('updated_at', datetime.utcnow())
+        now = _now()
+        self.created_at = data.get('created_at', now)
+        self.updated_at = data.get('updated_at', now)
     
     @staticmethod
     def validate(data: Dict[str, Any]) -> Dict[str, Any]:
@@ -37,8 +54,7 @@ class Overlay:
         
         if not data.get('type'):
             errors.append("Type is required")
-        
-        if data.get('type') not in ['text', 'image', 'logo']:
+        elif not isinstance(data['type'], str) or data['type'] not in _OVERLAY_TYPES:
             errors.append("Type must be 'text', 'image', or 'logo'")
         
         # Validate position
@@ -70,13 +86,47 @@ class Overlay:
                 errors.append("Font size must be a number")
             if 'opacity' in style and not (0 <= style['opacity'] <= 1):
                 errors.append("Opacity must be between 0 and 1")
-            if 'color' in style and not re.match(r'^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$', style['color']):
+            if 'color' in style and not _HEX_COLOR_RE.match(style['color']):
                 errors.append("Color must be a valid hex color")
         
         return {'valid': len(errors) == 0, 'errors': errors}
     
+    @staticmethod
+    def is_valid_fast(data: Dict[str, Any]) -> bool:
+        """Check overlay data, returning on the first error without collecting messages"""
+        overlay_type = data.get('type')
+        if not data.get('name') or not isinstance(overlay_type, str) or overlay_type not in _OVERLAY_TYPES:
+            return False
+        
+        position = data.get('position', {})
+        if not isinstance(position, dict):
+            return False
+        if not isinstance(position.get('x'), (int, float)) or not isinstance(position.get('y'), (int, float)):
+            return False
+        
+        size = data.get('size', {})
+        if not isinstance(size, dict):
+            return False
+        width, height = size.get('width'), size.get('height')
+        if not isinstance(width, (int, float)) or width <= 0:
+            return False
+        if not isinstance(height, (int, float)) or height <= 0:
+            return False
+        
+        style = data.get('style', {})
+        if not isinstance(style, dict):
+            return False
+        if 'fontSize' in style and not isinstance(style['fontSize'], (int, float)):
+            return False
+        if 'opacity' in style and not (0 <= style['opacity'] <= 1):
+            return False
+        if 'color' in style and not _HEX_COLOR_RE.match(style['color']):
+            return False
+        
+        return True
+    
     def to_dict(self) -> Dict[str, Any]:
-        """Convert overlay to dictionary"""
+        """Convert overlay to dictionary (datetimes are serialized by the JSON provider)"""
         return {
             '_id': str(self._id) if self._id else None,
             'user_id': self.user_id,
@@ -86,18 +136,27 @@ class Overlay:
             'position': self.position,
             'size': self.size,
             'style': self.style,
-            'created_at': self.created_at.isoformat() if isinstance(self.created_at, datetime) else self.created_at,
-            'updated_at': self.updated_at.isoformat() if isinstance(self.updated_at, datetime) else self.updated_at
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
         }
     
     def to_mongo_dict(self) -> Dict[str, Any]:
         """Convert overlay to MongoDB document format"""
-        doc = self.to_dict()
-        # Remove _id if it's None to let MongoDB auto-generate it
-        if doc['_id'] is None:
-            doc.pop('_id', None)
-        elif doc['_id']:
-            doc['_id'] = ObjectId(doc['_id'])
+        # Built straight from attributes so datetimes are stored as BSON dates
+        doc = {
+            'user_id': self.user_id,
+            'name': self.name,
+            'type': self.type,
+            'content': self.content,
+            'position': self.position,
+            'size': self.size,
+            'style': self.style,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+        # Leave _id out when unset to let MongoDB auto-generate it
+        if self._id:
+            doc['_id'] = self._id if isinstance(self._id, ObjectId) else ObjectId(self._id)
         return doc
     
     @classmethod
@@ -105,19 +164,31 @@ class Overlay:
         """Create overlay from MongoDB document"""
         return cls(doc)
     
+    @classmethod
+    def doc_to_dict(cls, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Equivalent of from_mongo_doc(doc).to_dict() for list endpoints"""
+        # A projected document carrying exactly the model's fields needs no defaults, so
+        # skip building the model and only stringify the id
+        if doc.keys() == cls._FIELDS:
+            doc['_id'] = str(doc['_id'])
+            return doc
+        return cls(doc).to_dict()
+    
     def update(self, data: Dict[str, Any]) -> None:
         """Update overlay with new data"""
-        if 'name' in data:
-            self.name = data['name']
-        if 'type' in data:
-            self.type = data['type']
-        if 'content' in data:
-            self.content = data['content']
-        if 'position' in data:
-            self.position = data['position']
-        if 'size' in data:
-            self.size = data['size']
+        for key in self._UPDATABLE:
+            if key in data:
+                setattr(self, key, data[key])
         if 'style' in data:
             self.style.update(data['style'])
         
-        self.updated_at = datetime.utcnow() 
\ No newline at end of file
+        self.updated_at = _now()
+    
+    @classmethod
+    def update_fields(cls, data: Dict[str, Any]) -> Dict[str, Any]:
+        """MongoDB $set document equivalent to update(data)"""
+        fields = {key: data[key] for key in cls._UPDATABLE if key in data}
+        for key, value in data.get('style', {}).items():
+            fields[f'style.{key}'] = value
+        fields['updated_at'] = _now()
+        return fields
\ No newline at end of file
@@ -1,11 +1,27 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, Any, Optional
 from bson import ObjectId
-import re
+
+def _now() -> datetime:
+    """Current UTC time as a naive datetime (replacement for datetime.utcnow)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+_STREAM_STATUSES = frozenset(('stopped', 'running', 'error'))
+_QUALITIES = frozenset(('low', 'medium', 'high'))
+_RESOLUTIONS = frozenset(('480p', '720p', '1080p'))
 
 class Stream:
     """Stream model for MongoDB"""
     
+    __slots__ = ('_id', 'user_id', 'name', 'rtsp_url', 'hls_url', 'status', 'is_active', 'overlay_ids',
+                 'settings', 'created_at', 'updated_at', 'last_started', 'last_stopped')
+    
+    # Fields replaced wholesale by update(); settings is merged instead
+    _UPDATABLE = ('name', 'rtsp_url', 'hls_url', 'status', 'is_active', 'overlay_ids')
+    
+    # Document keys that doc_to_dict can return as-is
+    _FIELDS = frozenset(__slots__)
+    
     def __init__(self, data: Dict[str, Any]):
         self._id = data.get('_id')
         self.user_id = data.get('user_id', 'default')
@@ -21,8 +37,9 @@ class Stream:
             'resolution': '720p',
             'bitrate': '1000k'
         })
-        self.created_at = data.get('created_at', datetime.utcnow())
-        self.updated_at = data.get('updated_at', datetime.utcnow())
+        now = _now()
+        self.created_at = data.get('created_at', now)
+        self.updated_at = data.get('updated_at', now)
         self.last_started = data.get('last_started')
         self.last_stopped = data.get('last_stopped')
     
@@ -44,7 +61,8 @@ class Stream:
             errors.append("RTSP URL must start with 'rtsp://'")
         
         # Validate status
-        if data.get('status') and data['status'] not in ['stopped', 'running', 'error']:
+        status = data.get('status')
+        if status and not (isinstance(status, str) and status in _STREAM_STATUSES):
             errors.append("Status must be 'stopped', 'running', or 'error'")
         
         # Validate settings
@@ -52,17 +70,19 @@ class Stream:
         if not isinstance(settings, dict):
             errors.append("Settings must be an object")
         else:
-            if 'quality' in settings and settings['quality'] not in ['low', 'medium', 'high']:
+            quality = settings.get('quality')
+            if 'quality' in settings and not (isinstance(quality, str) and quality in _QUALITIES):
                 errors.append("Quality must be 'low', 'medium', or 'high'")
             if 'fps' in settings and not isinstance(settings['fps'], int):
                 errors.append("FPS must be an integer")
-            if 'resolution' in settings and settings['resolution'] not in ['480p', '720p', '1080p']:
+            resolution = settings.get('resolution')
+            if 'resolution' in settings and not (isinstance(resolution, str) and resolution in _RESOLUTIONS):
                 errors.append("Resolution must be '480p', '720p', or '1080p'")
         
         return {'valid': len(errors) == 0, 'errors': errors}
     
     def to_dict(self) -> Dict[str, Any]:
-        """Convert stream to dictionary"""
+        """Convert stream to dictionary (datetimes are serialized by the JSON provider)"""
         return {
             '_id': str(self._id) if self._id else None,
             'user_id': self.user_id,
@@ -73,20 +93,32 @@ class Stream:
             'is_active': self.is_active,
             'overlay_ids': self.overlay_ids,
             'settings': self.settings,
-            'created_at': self.created_at.isoformat() if isinstance(self.created_at, datetime) else self.created_at,
-            'updated_at': self.updated_at.isoformat() if isinstance(self.updated_at, datetime) else self.updated_at,
-            'last_started': self.last_started.isoformat() if isinstance(self.last_started, datetime) else self.last_started,
-            'last_stopped': self.last_stopped.isoformat() if isinstance(self.last_stopped, datetime) else self.last_stopped
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'last_started': self.last_started,
+            'last_stopped': self.last_stopped
         }
     
     def to_mongo_dict(self) -> Dict[str, Any]:
         """Convert stream to MongoDB document format"""
-        doc = self.to_dict()
-        # Remove _id if it's None to let MongoDB auto-generate it
-        if doc['_id'] is None:
-            doc.pop('_id', None)
-        elif doc['_id']:
-            doc['_id'] = ObjectId(doc['_id'])
+        # Built straight from attributes so datetimes are stored as BSON dates
+        doc = {
+            'user_id': self.user_id,
+            'name': self.name,
+            'rtsp_url': self.rtsp_url,
+            'hls_url': self.hls_url,
+            'status': self.status,
+            'is_active': self.is_active,
+            'overlay_ids': self.overlay_ids,
+            'settings': self.settings,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'last_started': self.last_started,
+            'last_stopped': self.last_stopped
+        }
+        # Leave _id out when unset to let MongoDB auto-generate it
+        if self._id:
+            doc['_id'] = self._id if isinstance(self._id, ObjectId) else ObjectId(self._id)
         return doc
     
     @classmethod
@@ -94,41 +126,69 @@ class Stream:
         """Create stream from MongoDB document"""
         return cls(doc)
     
+    @classmethod
+    def doc_to_dict(cls, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Equivalent of from_mongo_doc(doc).to_dict() for list endpoints"""
+        # A projected document carrying exactly the model's fields needs no defaults, so
+        # skip building the model and only stringify the id
+        if doc.keys() == cls._FIELDS:
+            doc['_id'] = str(doc['_id'])
+            return doc
+        return cls(doc).to_dict()
+    
     def update(self, data: Dict[str, Any]) -> None:
         """Update stream with new data"""
-        if 'name' in data:
-            self.name = data['name']
-        if 'rtsp_url' in data:
-            self.rtsp_url = data['rtsp_url']
-        if 'hls_url' in data:
-            self.hls_url = data['hls_url']
-        if 'status' in data:
-            self.status = data['status']
-        if 'is_active' in data:
-            self.is_active = data['is_active']
-        if 'overlay_ids' in data:
-            self.overlay_ids = data['overlay_ids']
+        for key in self._UPDATABLE:
+            if key in data:
+                setattr(self, key, data[key])
         if 'settings' in data:
             self.settings.update(data['settings'])
         
-        self.updated_at = datetime.utcnow()
+        self.updated_at = _now()
+    
+    @classmethod
+    def update_fields(cls, data: Dict[str, Any]) -> Dict[str, Any]:
+        """MongoDB $set document equivalent to update(data)"""
+        fields = {key: data[key] for key in cls._UPDATABLE if key in data}
+        for key, value in data.get('settings', {}).items():
+            fields[f'settings.{key}'] = value
+        fields['updated_at'] = _now()
+        return fields
     
-    def start(self) -> None:
-        """Mark stream as started"""
+    def start(self, hls_url: Optional[str] = None) -> Dict[str, Any]:
+        """Mark stream as started, returning the changed fields for a $set"""
         self.status = 'running'
         self.is_active = True
-        self.last_started = datetime.utcnow()
-        self.updated_at = datetime.utcnow()
+        self.last_started = self.updated_at = _now()
+        changed = {
+            'status': self.status,
+            'is_active': self.is_active,
+            'last_started': self.last_started,
+            'updated_at': self.updated_at
+        }
+        if hls_url is not None:
+            self.hls_url = changed['hls_url'] = hls_url
+        return changed
     
-    def stop(self) -> None:
-        """Mark stream as stopped"""
+    def stop(self) -> Dict[str, Any]:
+        """Mark stream as stopped, returning the changed fields for a $set"""
         self.status = 'stopped'
         self.is_active = False
-        self.last_stopped = datetime.utcnow()
-        self.updated_at = datetime.utcnow()
+        self.last_stopped = self.updated_at = _now()
+        return {
+            'status': self.status,
+            'is_active': self.is_active,
+            'last_stopped': self.last_stopped,
+            'updated_at': self.updated_at
+        }
     
-    def set_error(self) -> None:
-        """Mark stream as error"""
+    def set_error(self) -> Dict[str, Any]:
+        """Mark stream as error, returning the changed fields for a $set"""
         self.status = 'error'
         self.is_active = False
-        self.updated_at = datetime.utcnow() 
\ No newline at end of file
+        self.updated_at = _now()
+        return {
+            'status': self.status,
+            'is_active': self.is_active,
+            'updated_at': self.updated_at
+        }
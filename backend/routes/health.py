@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify
 import logging
+from datetime import datetime, timezone
 from utils.database import get_db_manager
 from utils.stream_manager import get_stream_manager
 
@@ -12,8 +13,7 @@ def health_check():
     """Health check endpoint"""
     try:
         # Check database connection
-        db_manager = get_db_manager()
-        db_healthy = db_manager.health_check()
+        db_healthy = get_db_manager().health_check()
         
         # Check stream manager
         stream_manager = get_stream_manager()
@@ -23,7 +23,7 @@ def health_check():
             'status': 'healthy' if db_healthy else 'unhealthy',
             'database': 'connected' if db_healthy else 'disconnected',
             'active_streams': len(active_streams),
-            'timestamp': '2024-01-01T00:00:00Z'  # You can add proper timestamp here
+            'timestamp': datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
         }
         
         status_code = 200 if db_healthy else 503
@@ -41,8 +41,7 @@ def health_check():
 def database_health():
     """Database health check"""
     try:
-        db_manager = get_db_manager()
-        is_healthy = db_manager.health_check()
+        is_healthy = get_db_manager().health_check()
         
         return jsonify({
             'status': 'healthy' if is_healthy else 'unhealthy',
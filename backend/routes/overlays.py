@@ -1,337 +1,316 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from bson import ObjectId
-from typing import Dict, Any, List
+from pymongo import ReturnDocument
+from typing import Dict, Any, List, Tuple
 import logging
+import threading
+import time
 from models.overlay import Overlay
 from utils.database import get_collection
-from utils.validators import validate_overlay_data, validate_object_id, validate_pagination_params
+from utils.json_provider import dumps_bytes, stream_json_list
+from utils.validators import validate_overlay_data, parse_object_id, validate_pagination_params
 
 logger = logging.getLogger(__name__)
 
 overlays_bp = Blueprint('overlays', __name__, url_prefix='/api/overlays')
 
-@overlays_bp.route('/', methods=['OPTIONS'])
-def handle_overlays_options():
-    """Handle OPTIONS requests for overlays endpoint"""
-    response = jsonify({'success': True})
-    response.headers['Access-Control-Allow-Origin'] = '*'
-    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Accept, Origin, X-Requested-With'
-    response.headers['Access-Control-Max-Age'] = '3600'
-    return response
+# Only decode the fields the Overlay model reads
+OVERLAY_PROJECTION = {field: 1 for field in Overlay.__slots__}
+
+# Seconds a serialized GET response is reused. PUT/DELETE evict the entry in
+# this worker; other workers may serve the old body until it expires.
+OVERLAY_CACHE_TTL = 5.0
+OVERLAY_CACHE_SIZE = 1024
+
+_overlay_cache: Dict[ObjectId, Tuple[float, bytes]] = {}
+_overlay_cache_lock = threading.Lock()
+# Bumped by every eviction, so a GET that read the document before a
+# PUT/DELETE can tell and doesn't cache its stale body
+_overlay_cache_generation = 0
+
+def _cache_overlay_body(oid: ObjectId, body: bytes, generation: int) -> None:
+    """Store a serialized overlay response read at generation, evicting the oldest entry when full"""
+    with _overlay_cache_lock:
+        if generation != _overlay_cache_generation:
+            return
+        if len(_overlay_cache) >= OVERLAY_CACHE_SIZE:
+            del _overlay_cache[next(iter(_overlay_cache))]
+        _overlay_cache[oid] = (time.monotonic() + OVERLAY_CACHE_TTL, body)
+
+def _evict_overlay(oid: ObjectId) -> None:
+    """Drop a cached overlay response after it has been modified"""
+    global _overlay_cache_generation
+    with _overlay_cache_lock:
+        _overlay_cache.pop(oid, None)
+        _overlay_cache_generation += 1
 
 @overlays_bp.route('/', methods=['GET'])
 def get_overlays():
     """Get all overlays with pagination"""
-    try:
-        # Get query parameters
-        page = request.args.get('page', 1, type=int)
-        limit = request.args.get('limit', 10, type=int)
-        user_id = request.args.get('user_id', 'default')
-        
-        # Validate pagination parameters
-        pagination_validation = validate_pagination_params(page, limit)
-        if not pagination_validation['valid']:
-            return jsonify({
-                'success': False,
-                'error': 'Invalid pagination parameters',
-                'details': pagination_validation['errors']
-            }), 400
-        
-        # Get overlays from database
-        collection = get_collection('overlays')
-        cursor = collection.find({'user_id': user_id}).sort('created_at', -1)
-        
-        overlays = []
-        for doc in cursor:
-            overlay = Overlay.from_mongo_doc(doc)
-            overlays.append(overlay.to_dict())
-        
-        total_count = len(overlays)
-        
-        return jsonify({
-            'success': True,
-            'data': overlays,
-            'pagination': {
-                'page': page,
-                'limit': limit,
-                'total': total_count,
-                'pages': (total_count + limit - 1) // limit
-            }
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Error getting overlays: {e}")
+    # Get query parameters
+    page = request.args.get('page', 1, type=int)
+    limit = request.args.get('limit', 10, type=int)
+    user_id = request.args.get('user_id', 'default')
+    
+    # Validate pagination parameters
+    pagination_validation = validate_pagination_params(page, limit)
+    if not pagination_validation['valid']:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Invalid pagination parameters',
+            'details': pagination_validation['errors']
+        }), 400
+    
+    # Get the requested page of overlays from database in a single batch
+    collection = get_collection('overlays')
+    query = {'user_id': user_id}
+    cursor = (collection.find(query, OVERLAY_PROJECTION)
+              .sort('_id', -1)
+              .skip((page - 1) * limit)
+              .limit(limit)
+              .batch_size(limit))
+    
+    # Fetch the page (at most limit documents) before the response starts, so a
+    # database error still becomes a JSON error instead of a truncated body
+    docs = list(cursor)
+    total_count = collection.count_documents(query)
+    
+    return stream_json_list(
+        (Overlay.doc_to_dict(doc) for doc in docs),
+        pagination={
+            'page': page,
+            'limit': limit,
+            'total': total_count,
+            'pages': (total_count + limit - 1) // limit
+        }
+    )
 
 @overlays_bp.route('/<overlay_id>', methods=['GET'])
 def get_overlay(overlay_id: str):
     """Get a specific overlay by ID"""
-    try:
-        # Validate ObjectId
-        if not validate_object_id(overlay_id):
-            return jsonify({
-                'success': False,
-                'error': 'Invalid overlay ID format'
-            }), 400
-        
-        # Get overlay from database
-        collection = get_collection('overlays')
-        doc = collection.find_one({'_id': ObjectId(overlay_id)})
-        
-        if not doc:
-            return jsonify({
-                'success': False,
-                'error': 'Overlay not found'
-            }), 404
-        
-        overlay = Overlay.from_mongo_doc(doc)
-        
+    # Parse ObjectId
+    oid = parse_object_id(overlay_id)
+    if oid is None:
         return jsonify({
-            'success': True,
-            'data': overlay.to_dict()
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Error getting overlay {overlay_id}: {e}")
+            'success': False,
+            'error': 'Invalid overlay ID format'
+        }), 400
+    
+    # Serve a recently serialized response if there is one
+    cached = _overlay_cache.get(oid)
+    if cached and cached[0] > time.monotonic():
+        return Response(cached[1], mimetype='application/json')
+    
+    # Get overlay from database
+    generation = _overlay_cache_generation
+    collection = get_collection('overlays')
+    doc = collection.find_one({'_id': oid}, OVERLAY_PROJECTION)
+    
+    if not doc:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Overlay not found'
+        }), 404
+    
+    body = dumps_bytes({
+        'success': True,
+        'data': Overlay.doc_to_dict(doc)
+    })
+    _cache_overlay_body(oid, body, generation)
+    
+    return Response(body, mimetype='application/json')
 
 @overlays_bp.route('/', methods=['POST'])
 def create_overlay():
     """Create a new overlay"""
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'error': 'Request body is required'
-            }), 400
-        
-        # Validate overlay data
-        validation = validate_overlay_data(data)
-        if not validation['valid']:
-            return jsonify({
-                'success': False,
-                'error': 'Invalid overlay data',
-                'details': validation['errors']
-            }), 400
-        
-        # Add user_id if not provided
-        if 'user_id' not in data:
-            data['user_id'] = 'default'
-        
-        # Create overlay object
-        overlay = Overlay(data)
-        
-        # Save to database
-        collection = get_collection('overlays')
-        result = collection.insert_one(overlay.to_mongo_dict())
-        
-        # Get the created overlay
-        overlay._id = result.inserted_id
-        created_overlay = overlay.to_dict()
-        
-        logger.info(f"Created overlay: {created_overlay['_id']}")
-        
+    data = request.get_json()
+    
+    if not data:
         return jsonify({
-            'success': True,
-            'data': created_overlay,
-            'message': 'Overlay created successfully'
-        }), 201
-        
-    except Exception as e:
-        logger.error(f"Error creating overlay: {e}")
+            'success': False,
+            'error': 'Request body is required'
+        }), 400
+    
+    # Validate overlay data
+    validation = validate_overlay_data(data)
+    if not validation['valid']:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Invalid overlay data',
+            'details': validation['errors']
+        }), 400
+    
+    # Add user_id if not provided
+    if 'user_id' not in data:
+        data['user_id'] = 'default'
+    
+    # Create overlay object
+    overlay = Overlay(data)
+    
+    # Save to database
+    collection = get_collection('overlays')
+    result = collection.insert_one(overlay.to_mongo_dict())
+    
+    # Get the created overlay
+    overlay._id = result.inserted_id
+    created_overlay = overlay.to_dict()
+    
+    logger.debug("Created overlay: %s", created_overlay['_id'])
+    
+    return jsonify({
+        'success': True,
+        'data': created_overlay,
+        'message': 'Overlay created successfully'
+    }), 201
 
 @overlays_bp.route('/<overlay_id>', methods=['PUT'])
 def update_overlay(overlay_id: str):
     """Update an existing overlay"""
-    try:
-        # Validate ObjectId
-        if not validate_object_id(overlay_id):
-            return jsonify({
-                'success': False,
-                'error': 'Invalid overlay ID format'
-            }), 400
-        
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'error': 'Request body is required'
-            }), 400
-        
-        # Validate overlay data
-        validation = validate_overlay_data(data)
-        if not validation['valid']:
-            return jsonify({
-                'success': False,
-                'error': 'Invalid overlay data',
-                'details': validation['errors']
-            }), 400
-        
-        # Get existing overlay
-        collection = get_collection('overlays')
-        doc = collection.find_one({'_id': ObjectId(overlay_id)})
-        
-        if not doc:
-            return jsonify({
-                'success': False,
-                'error': 'Overlay not found'
-            }), 404
-        
-        overlay = Overlay.from_mongo_doc(doc)
-        
-        # Update overlay
-        overlay.update(data)
-        
-        # Save to database
-        collection.update_one(
-            {'_id': ObjectId(overlay_id)},
-            {'$set': overlay.to_mongo_dict()}
-        )
-        
-        logger.info(f"Updated overlay: {overlay_id}")
-        
+    # Parse ObjectId
+    oid = parse_object_id(overlay_id)
+    if oid is None:
         return jsonify({
-            'success': True,
-            'data': overlay.to_dict(),
-            'message': 'Overlay updated successfully'
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Error updating overlay {overlay_id}: {e}")
+            'success': False,
+            'error': 'Invalid overlay ID format'
+        }), 400
+    
+    data = request.get_json()
+    
+    if not data:
+        return jsonify({
+            'success': False,
+            'error': 'Request body is required'
+        }), 400
+    
+    # Validate overlay data
+    validation = validate_overlay_data(data)
+    if not validation['valid']:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Invalid overlay data',
+            'details': validation['errors']
+        }), 400
+    
+    # Apply the update atomically and get the merged document back
+    collection = get_collection('overlays')
+    doc = collection.find_one_and_update(
+        {'_id': oid},
+        {'$set': Overlay.update_fields(data)},
+        projection=OVERLAY_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    
+    if not doc:
+        return jsonify({
+            'success': False,
+            'error': 'Overlay not found'
+        }), 404
+    
+    overlay = Overlay.from_mongo_doc(doc)
+    
+    _evict_overlay(oid)
+    logger.debug("Updated overlay: %s", overlay_id)
+    
+    return jsonify({
+        'success': True,
+        'data': overlay.to_dict(),
+        'message': 'Overlay updated successfully'
+    }), 200
 
 @overlays_bp.route('/<overlay_id>', methods=['DELETE'])
 def delete_overlay(overlay_id: str):
     """Delete an overlay"""
-    try:
-        # Validate ObjectId
-        if not validate_object_id(overlay_id):
-            return jsonify({
-                'success': False,
-                'error': 'Invalid overlay ID format'
-            }), 400
-        
-        # Delete from database
-        collection = get_collection('overlays')
-        result = collection.delete_one({'_id': ObjectId(overlay_id)})
-        
-        if result.deleted_count == 0:
-            return jsonify({
-                'success': False,
-                'error': 'Overlay not found'
-            }), 404
-        
-        logger.info(f"Deleted overlay: {overlay_id}")
-        
+    # Parse ObjectId
+    oid = parse_object_id(overlay_id)
+    if oid is None:
         return jsonify({
-            'success': True,
-            'message': 'Overlay deleted successfully'
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Error deleting overlay {overlay_id}: {e}")
+            'success': False,
+            'error': 'Invalid overlay ID format'
+        }), 400
+    
+    # Delete from database
+    collection = get_collection('overlays')
+    result = collection.delete_one({'_id': oid})
+    
+    if result.deleted_count == 0:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Overlay not found'
+        }), 404
+    
+    _evict_overlay(oid)
+    logger.debug("Deleted overlay: %s", overlay_id)
+    
+    return jsonify({
+        'success': True,
+        'message': 'Overlay deleted successfully'
+    }), 200
 
 @overlays_bp.route('/batch', methods=['POST'])
 def create_multiple_overlays():
     """Create multiple overlays at once"""
-    try:
-        data = request.get_json()
-        
-        if not data or not isinstance(data.get('overlays'), list):
-            return jsonify({
-                'success': False,
-                'error': 'Request body must contain overlays array'
-            }), 400
-        
-        overlays_data = data['overlays']
-        user_id = data.get('user_id', 'default')
-        
-        created_overlays = []
-        errors = []
-        
-        for i, overlay_data in enumerate(overlays_data):
-            # Validate overlay data
+    data = request.get_json()
+    
+    if not data or not isinstance(data.get('overlays'), list):
+        return jsonify({
+            'success': False,
+            'error': 'Request body must contain overlays array'
+        }), 400
+    
+    overlays_data = data['overlays']
+    user_id = data.get('user_id', 'default')
+    
+    overlay_docs = []
+    created_data = []
+    errors = []
+    
+    for i, overlay_data in enumerate(overlays_data):
+        # Validate overlay data, only collecting messages for invalid items
+        if not Overlay.is_valid_fast(overlay_data):
             validation = validate_overlay_data(overlay_data)
-            if not validation['valid']:
-                errors.append({
-                    'index': i,
-                    'errors': validation['errors']
-                })
-                continue
-            
-            # Add user_id if not provided
-            if 'user_id' not in overlay_data:
-                overlay_data['user_id'] = user_id
-            
-            # Create overlay object
-            overlay = Overlay(overlay_data)
-            created_overlays.append(overlay)
+            errors.append({
+                'index': i,
+                'errors': validation['errors']
+            })
+            continue
         
         if errors:
-            return jsonify({
-                'success': False,
-                'error': 'Some overlays have validation errors',
-                'details': errors
-            }), 400
-        
-        # Save to database
-        collection = get_collection('overlays')
-        overlay_docs = [overlay.to_mongo_dict() for overlay in created_overlays]
-        result = collection.insert_many(overlay_docs)
-        
-        # Update overlays with their IDs
-        for i, overlay in enumerate(created_overlays):
-            overlay._id = result.inserted_ids[i]
+            # The batch is rejected anyway, only keep validating
+            continue
         
-        created_data = [overlay.to_dict() for overlay in created_overlays]
-        
-        logger.info(f"Created {len(created_overlays)} overlays")
-        
-        return jsonify({
-            'success': True,
-            'data': created_data,
-            'message': f'Created {len(created_overlays)} overlays successfully'
-        }), 201
-        
-    except Exception as e:
-        logger.error(f"Error creating multiple overlays: {e}")
+        # Add user_id if not provided
+        if 'user_id' not in overlay_data:
+            overlay_data['user_id'] = user_id
+        
+        # Create overlay object with a client-side id so no post-insert pass is needed
+        overlay = Overlay(overlay_data)
+        overlay._id = ObjectId()
+        overlay_docs.append(overlay.to_mongo_dict())
+        created_data.append(overlay.to_dict())
+    
+    if errors:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Some overlays have validation errors',
+            'details': errors
+        }), 400
+    
+    # Save to database
+    collection = get_collection('overlays')
+    collection.insert_many(overlay_docs, ordered=False)
+    
+    logger.debug("Created %s overlays", len(created_data))
+    
+    return jsonify({
+        'success': True,
+        'data': created_data,
+        'message': f'Created {len(created_data)} overlays successfully'
+    }), 201
 
 @overlays_bp.route('/test', methods=['GET'])
 def test_overlays():
     """Test endpoint for overlays"""
-    try:
-        return jsonify({
-            'success': True,
-            'message': 'Overlays blueprint is working'
-        }), 200
-    except Exception as e:
-        logger.error(f"Error in test endpoint: {e}")
-        return jsonify({
-            'success': False,
-            'error': 'Internal server error'
-        }), 500 
\ No newline at end of file
+    return jsonify({
+        'success': True,
+        'message': 'Overlays blueprint is working'
+    }), 200
\ No newline at end of file
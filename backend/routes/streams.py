@@ -1,433 +1,381 @@
-from flask import Blueprint, request, jsonify, send_from_directory
-from bson import ObjectId
+from flask import Blueprint, current_app, request, jsonify, send_from_directory
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from pymongo import ReturnDocument
 from typing import Dict, Any, List
 import logging
-import os
 from models.stream import Stream
 from utils.database import get_collection
+from utils.json_provider import stream_json_list
 from utils.stream_manager import get_stream_manager
-from utils.validators import validate_stream_data, validate_object_id, validate_rtsp_url
+from utils.validators import validate_stream_data, parse_object_id, validate_rtsp_url, validate_pagination_params
 
 logger = logging.getLogger(__name__)
 
 streams_bp = Blueprint('streams', __name__, url_prefix='/api/streams')
 
-@streams_bp.route('/', methods=['OPTIONS'])
-def handle_streams_options():
-    """Handle OPTIONS requests for streams endpoint"""
-    response = jsonify({'success': True})
-    response.headers['Access-Control-Allow-Origin'] = '*'
-    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Accept, Origin, X-Requested-With'
-    response.headers['Access-Control-Max-Age'] = '3600'
-    return response
+# Only decode the fields the Stream model reads
+STREAM_PROJECTION = {field: 1 for field in Stream.__slots__}
+
+# Fields the stream manager needs to start a stream
+START_PROJECTION = {'rtsp_url': 1, 'settings': 1}
 
 @streams_bp.route('/', methods=['GET'])
 def get_streams():
-    """Get all streams"""
-    try:
-        user_id = request.args.get('user_id', 'default')
-        
-        # Get streams from database
-        collection = get_collection('streams')
-        cursor = collection.find({'user_id': user_id}).sort('created_at', -1)
-        
-        streams = []
-        for doc in cursor:
-            stream = Stream.from_mongo_doc(doc)
-            streams.append(stream.to_dict())
-        
-        return jsonify({
-            'success': True,
-            'data': streams
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Error getting streams: {e}")
+    """Get all streams with pagination"""
+    # Get query parameters
+    page = request.args.get('page', 1, type=int)
+    limit = request.args.get('limit', 50, type=int)
+    user_id = request.args.get('user_id', 'default')
+    
+    # Validate pagination parameters
+    pagination_validation = validate_pagination_params(page, limit)
+    if not pagination_validation['valid']:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Invalid pagination parameters',
+            'details': pagination_validation['errors']
+        }), 400
+    
+    # Get the requested page of streams from database in a single batch
+    collection = get_collection('streams')
+    query = {'user_id': user_id}
+    cursor = (collection.find(query, STREAM_PROJECTION)
+              .sort('_id', -1)
+              .skip((page - 1) * limit)
+              .limit(limit)
+              .batch_size(limit))
+    
+    # Fetch the page (at most limit documents) before the response starts, so a
+    # database error still becomes a JSON error instead of a truncated body
+    docs = list(cursor)
+    total_count = collection.count_documents(query)
+    
+    return stream_json_list(
+        (Stream.doc_to_dict(doc) for doc in docs),
+        pagination={
+            'page': page,
+            'limit': limit,
+            'total': total_count,
+            'pages': (total_count + limit - 1) // limit
+        }
+    )
 
 @streams_bp.route('/<stream_id>', methods=['GET'])
 def get_stream(stream_id: str):
     """Get a specific stream by ID"""
-    try:
-        # Validate ObjectId
-        if not validate_object_id(stream_id):
-            return jsonify({
-                'success': False,
-                'error': 'Invalid stream ID format'
-            }), 400
-        
-        # Get stream from database
-        collection = get_collection('streams')
-        doc = collection.find_one({'_id': ObjectId(stream_id)})
-        
-        if not doc:
-            return jsonify({
-                'success': False,
-                'error': 'Stream not found'
-            }), 404
-        
-        stream = Stream.from_mongo_doc(doc)
-        
-        # Get current stream status from stream manager
-        stream_manager = get_stream_manager()
-        status_info = stream_manager.get_stream_status(stream_id)
-        
-        stream_data = stream.to_dict()
-        stream_data['current_status'] = status_info
-        
+    # Parse ObjectId
+    oid = parse_object_id(stream_id)
+    if oid is None:
         return jsonify({
-            'success': True,
-            'data': stream_data
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Error getting stream {stream_id}: {e}")
+            'success': False,
+            'error': 'Invalid stream ID format'
+        }), 400
+    
+    # Get stream from database
+    collection = get_collection('streams')
+    doc = collection.find_one({'_id': oid}, STREAM_PROJECTION)
+    
+    if not doc:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Stream not found'
+        }), 404
+    
+    stream = Stream.from_mongo_doc(doc)
+    
+    # Get current stream status from stream manager
+    stream_manager = get_stream_manager()
+    status_info = stream_manager.get_stream_status(stream_id)
+    
+    stream_data = stream.to_dict()
+    stream_data['current_status'] = status_info
+    
+    return jsonify({
+        'success': True,
+        'data': stream_data
+    }), 200
 
 @streams_bp.route('/', methods=['POST'])
 def create_stream():
     """Create a new stream"""
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'error': 'Request body is required'
-            }), 400
-        
-        # Validate stream data
-        validation = validate_stream_data(data)
-        if not validation['valid']:
-            return jsonify({
-                'success': False,
-                'error': 'Invalid stream data',
-                'details': validation['errors']
-            }), 400
-        
-        # Add user_id if not provided
-        if 'user_id' not in data:
-            data['user_id'] = 'default'
-        
-        # Create stream object
-        stream = Stream(data)
-        
-        # Save to database
-        collection = get_collection('streams')
-        result = collection.insert_one(stream.to_mongo_dict())
-        
-        # Get the created stream
-        stream._id = result.inserted_id
-        created_stream = stream.to_dict()
-        
-        logger.info(f"Created stream: {created_stream['_id']}")
-        
+    data = request.get_json()
+    
+    if not data:
         return jsonify({
-            'success': True,
-            'data': created_stream,
-            'message': 'Stream created successfully'
-        }), 201
-        
-    except Exception as e:
-        logger.error(f"Error creating stream: {e}")
+            'success': False,
+            'error': 'Request body is required'
+        }), 400
+    
+    # Validate stream data
+    validation = validate_stream_data(data)
+    if not validation['valid']:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Invalid stream data',
+            'details': validation['errors']
+        }), 400
+    
+    # Add user_id if not provided
+    if 'user_id' not in data:
+        data['user_id'] = 'default'
+    
+    # Create stream object
+    stream = Stream(data)
+    
+    # Save to database
+    collection = get_collection('streams')
+    result = collection.insert_one(stream.to_mongo_dict())
+    
+    # Get the created stream
+    stream._id = result.inserted_id
+    created_stream = stream.to_dict()
+    
+    logger.debug("Created stream: %s", created_stream['_id'])
+    
+    return jsonify({
+        'success': True,
+        'data': created_stream,
+        'message': 'Stream created successfully'
+    }), 201
 
 @streams_bp.route('/<stream_id>', methods=['PUT'])
 def update_stream(stream_id: str):
     """Update an existing stream"""
-    try:
-        # Validate ObjectId
-        if not validate_object_id(stream_id):
-            return jsonify({
-                'success': False,
-                'error': 'Invalid stream ID format'
-            }), 400
-        
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'error': 'Request body is required'
-            }), 400
-        
-        # Validate stream data
-        validation = validate_stream_data(data)
-        if not validation['valid']:
-            return jsonify({
-                'success': False,
-                'error': 'Invalid stream data',
-                'details': validation['errors']
-            }), 400
-        
-        # Get existing stream
-        collection = get_collection('streams')
-        doc = collection.find_one({'_id': ObjectId(stream_id)})
-        
-        if not doc:
-            return jsonify({
-                'success': False,
-                'error': 'Stream not found'
-            }), 404
-        
-        stream = Stream.from_mongo_doc(doc)
-        
-        # Update stream
-        stream.update(data)
-        
-        # Save to database
-        collection.update_one(
-            {'_id': ObjectId(stream_id)},
-            {'$set': stream.to_mongo_dict()}
-        )
-        
-        logger.info(f"Updated stream: {stream_id}")
-        
+    # Parse ObjectId
+    oid = parse_object_id(stream_id)
+    if oid is None:
         return jsonify({
-            'success': True,
-            'data': stream.to_dict(),
-            'message': 'Stream updated successfully'
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Error updating stream {stream_id}: {e}")
+            'success': False,
+            'error': 'Invalid stream ID format'
+        }), 400
+    
+    data = request.get_json()
+    
+    if not data:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Request body is required'
+        }), 400
+    
+    # Validate stream data
+    validation = validate_stream_data(data)
+    if not validation['valid']:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid stream data',
+            'details': validation['errors']
+        }), 400
+    
+    # Apply the update atomically and get the merged document back
+    collection = get_collection('streams')
+    doc = collection.find_one_and_update(
+        {'_id': oid},
+        {'$set': Stream.update_fields(data)},
+        projection=STREAM_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    
+    if not doc:
+        return jsonify({
+            'success': False,
+            'error': 'Stream not found'
+        }), 404
+    
+    stream = Stream.from_mongo_doc(doc)
+    
+    logger.debug("Updated stream: %s", stream_id)
+    
+    return jsonify({
+        'success': True,
+        'data': stream.to_dict(),
+        'message': 'Stream updated successfully'
+    }), 200
 
 @streams_bp.route('/<stream_id>', methods=['DELETE'])
 def delete_stream(stream_id: str):
     """Delete a stream"""
-    try:
-        # Validate ObjectId
-        if not validate_object_id(stream_id):
-            return jsonify({
-                'success': False,
-                'error': 'Invalid stream ID format'
-            }), 400
-        
-        # Stop stream if running
-        stream_manager = get_stream_manager()
-        stream_manager.stop_stream(stream_id)
-        
-        # Delete from database
-        collection = get_collection('streams')
-        result = collection.delete_one({'_id': ObjectId(stream_id)})
-        
-        if result.deleted_count == 0:
-            return jsonify({
-                'success': False,
-                'error': 'Stream not found'
-            }), 404
-        
-        logger.info(f"Deleted stream: {stream_id}")
-        
+    # Parse ObjectId
+    oid = parse_object_id(stream_id)
+    if oid is None:
         return jsonify({
-            'success': True,
-            'message': 'Stream deleted successfully'
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Error deleting stream {stream_id}: {e}")
+            'success': False,
+            'error': 'Invalid stream ID format'
+        }), 400
+    
+    # Stop stream if running
+    stream_manager = get_stream_manager()
+    stream_manager.stop_stream(stream_id)
+    
+    # Delete from database
+    collection = get_collection('streams')
+    result = collection.delete_one({'_id': oid})
+    
+    if result.deleted_count == 0:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Stream not found'
+        }), 404
+    
+    logger.debug("Deleted stream: %s", stream_id)
+    
+    return jsonify({
+        'success': True,
+        'message': 'Stream deleted successfully'
+    }), 200
 
 @streams_bp.route('/<stream_id>/start', methods=['POST'])
 def start_stream(stream_id: str):
     """Start a stream"""
-    try:
-        # Validate ObjectId
-        if not validate_object_id(stream_id):
-            return jsonify({
-                'success': False,
-                'error': 'Invalid stream ID format'
-            }), 400
-        
-        # Get stream from database
-        collection = get_collection('streams')
-        doc = collection.find_one({'_id': ObjectId(stream_id)})
-        
-        if not doc:
-            return jsonify({
-                'success': False,
-                'error': 'Stream not found'
-            }), 404
-        
-        stream = Stream.from_mongo_doc(doc)
-        
-        # Start stream using stream manager
-        stream_manager = get_stream_manager()
-        result = stream_manager.start_stream(
-            stream_id=str(stream._id),
-            rtsp_url=stream.rtsp_url,
-            settings=stream.settings
-        )
-        
-        if not result['success']:
-            return jsonify({
-                'success': False,
-                'error': result['error']
-            }), 400
-        
-        # Update stream status in database
-        stream.start()
-        collection.update_one(
-            {'_id': ObjectId(stream_id)},
-            {'$set': stream.to_mongo_dict()}
-        )
-        
-        logger.info(f"Started stream: {stream_id}")
-        
+    # Parse ObjectId
+    oid = parse_object_id(stream_id)
+    if oid is None:
         return jsonify({
-            'success': True,
-            'data': {
-                'stream_id': stream_id,
-                'hls_url': result['hls_url'],
-                'status': result['status']
-            },
-            'message': 'Stream started successfully'
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Error starting stream {stream_id}: {e}")
+            'success': False,
+            'error': 'Invalid stream ID format'
+        }), 400
+    
+    # Get stream from database
+    collection = get_collection('streams')
+    doc = collection.find_one({'_id': oid}, START_PROJECTION)
+    
+    if not doc:
+        return jsonify({
+            'success': False,
+            'error': 'Stream not found'
+        }), 404
+    
+    stream = Stream.from_mongo_doc(doc)
+    
+    # Start stream using stream manager
+    stream_manager = get_stream_manager()
+    result = stream_manager.start_stream(
+        stream_id=str(stream._id),
+        rtsp_url=stream.rtsp_url,
+        settings=stream.settings
+    )
+    
+    if not result['success']:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': result['error']
+        }), 400
+    
+    # Write only the status fields that changed
+    collection.update_one(
+        {'_id': oid},
+        {'$set': stream.start(result['hls_url'])}
+    )
+    
+    logger.info("Started stream: %s", stream_id)
+    
+    return jsonify({
+        'success': True,
+        'data': {
+            'stream_id': stream_id,
+            'hls_url': result['hls_url'],
+            'status': result['status']
+        },
+        'message': 'Stream started successfully'
+    }), 200
 
 @streams_bp.route('/<stream_id>/stop', methods=['POST'])
 def stop_stream(stream_id: str):
     """Stop a stream"""
-    try:
-        # Validate ObjectId
-        if not validate_object_id(stream_id):
-            return jsonify({
-                'success': False,
-                'error': 'Invalid stream ID format'
-            }), 400
-        
-        # Get stream from database
-        collection = get_collection('streams')
-        doc = collection.find_one({'_id': ObjectId(stream_id)})
-        
-        if not doc:
-            return jsonify({
-                'success': False,
-                'error': 'Stream not found'
-            }), 404
-        
-        stream = Stream.from_mongo_doc(doc)
-        
-        # Stop stream using stream manager
-        stream_manager = get_stream_manager()
-        result = stream_manager.stop_stream(stream_id=str(stream._id))
-        
-        if not result['success']:
-            return jsonify({
-                'success': False,
-                'error': result['error']
-            }), 400
-        
-        # Update stream status in database
-        stream.stop()
-        collection.update_one(
-            {'_id': ObjectId(stream_id)},
-            {'$set': stream.to_mongo_dict()}
-        )
-        
-        logger.info(f"Stopped stream: {stream_id}")
-        
+    # Parse ObjectId
+    oid = parse_object_id(stream_id)
+    if oid is None:
         return jsonify({
-            'success': True,
-            'message': 'Stream stopped successfully'
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Error stopping stream {stream_id}: {e}")
+            'success': False,
+            'error': 'Invalid stream ID format'
+        }), 400
+    
+    # Get stream from database
+    collection = get_collection('streams')
+    doc = collection.find_one({'_id': oid}, {'_id': 1})
+    
+    if not doc:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Stream not found'
+        }), 404
+    
+    stream = Stream.from_mongo_doc(doc)
+    
+    # Stop stream using stream manager
+    stream_manager = get_stream_manager()
+    result = stream_manager.stop_stream(stream_id=str(stream._id))
+    
+    if not result['success']:
+        return jsonify({
+            'success': False,
+            'error': result['error']
+        }), 400
+    
+    # Write only the status fields that changed
+    collection.update_one(
+        {'_id': oid},
+        {'$set': stream.stop()}
+    )
+    
+    logger.info("Stopped stream: %s", stream_id)
+    
+    return jsonify({
+        'success': True,
+        'message': 'Stream stopped successfully'
+    }), 200
 
 @streams_bp.route('/<stream_id>/status', methods=['GET'])
 def get_stream_status(stream_id: str):
     """Get stream status"""
-    try:
-        # Validate ObjectId
-        if not validate_object_id(stream_id):
-            return jsonify({
-                'success': False,
-                'error': 'Invalid stream ID format'
-            }), 400
-        
-        # Get stream status from stream manager
-        stream_manager = get_stream_manager()
-        status_info = stream_manager.get_stream_status(stream_id)
-        
-        return jsonify({
-            'success': True,
-            'data': status_info
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Error getting stream status {stream_id}: {e}")
+    # Parse ObjectId
+    if parse_object_id(stream_id) is None:
         return jsonify({
             'success': False,
-            'error': 'Internal server error'
-        }), 500
+            'error': 'Invalid stream ID format'
+        }), 400
+    
+    # Get stream status from stream manager
+    stream_manager = get_stream_manager()
+    status_info = stream_manager.get_stream_status(stream_id)
+    
+    return jsonify({
+        'success': True,
+        'data': status_info
+    }), 200
 
 @streams_bp.route('/active', methods=['GET'])
 def get_active_streams():
     """Get all active streams"""
-    try:
-        stream_manager = get_stream_manager()
-        active_streams = stream_manager.get_all_streams()
-        
-        return jsonify({
-            'success': True,
-            'data': active_streams
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Error getting active streams: {e}")
-        return jsonify({
-            'success': False,
-            'error': 'Internal server error'
-        }), 500
+    stream_manager = get_stream_manager()
+    active_streams = stream_manager.get_all_streams()
+    
+    return jsonify({
+        'success': True,
+        'data': active_streams
+    }), 200
 
 @streams_bp.route('/hls/<path:filename>')
 def serve_hls_file(filename):
     """Serve HLS files (playlist.m3u8 and .ts segments)"""
-    try:
-        streams_dir = os.path.join(os.getcwd(), 'streams')
-        logger.info(f"Serving HLS file: {filename} from directory: {streams_dir}")
-        
-        # Check if file exists
-        file_path = os.path.join(streams_dir, filename)
-        if not os.path.exists(file_path):
-            logger.warning(f"HLS file not found: {file_path}")
+    streams_dir = current_app.config['STREAMS_DIR']
+    
+    # Behind nginx, hand the file off via X-Accel-Redirect so it is sent with sendfile
+    accel_prefix = current_app.config.get('HLS_ACCEL_REDIRECT')
+    if accel_prefix:
+        if safe_join(streams_dir, filename) is None:
             return jsonify({
                 'success': False,
                 'error': 'File not found'
             }), 404
-        
-        return send_from_directory(streams_dir, filename)
-    except Exception as e:
-        logger.error(f"Error serving HLS file {filename}: {e}")
+        response = current_app.response_class()
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename
+        return response
+    
+    try:
+        return send_from_directory(streams_dir, filename, conditional=True)
+    except NotFound:
         return jsonify({
             'success': False,
             'error': 'File not found'
-        }), 404 
\ No newline at end of file
+        }), 404
@@ -5,7 +5,7 @@ Run script for Livesitter Backend
 
 import os
 import sys
-from app import create_app
+from app import create_app, exec_gunicorn, exit_on_sigterm, check_werkzeug_version
 
 def main():
     """Main entry point"""
@@ -14,14 +14,21 @@ def main():
     if not os.environ.get('FLASK_ENV'):
         os.environ['FLASK_ENV'] = 'development'
     
-    # Create app
-    app = create_app()
-    
     # Get configuration
+    config_name = os.environ['FLASK_ENV']
     host = os.environ.get('FLASK_HOST', '0.0.0.0')
     port = int(os.environ.get('FLASK_PORT', 5000))
     debug = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
     
+    # Anything but development is served by gunicorn with gevent workers
+    if config_name != 'development':
+        exec_gunicorn(config_name, host, port)
+    
+    check_werkzeug_version()
+    
+    # Create app
+    app = create_app(config_name)
+    
     print(f"Starting Livesitter Backend...")
     print(f"Environment: {os.environ.get('FLASK_ENV')}")
     print(f"Host: {host}")
@@ -33,6 +40,7 @@ def main():
     print()
     
     # Run app
+    exit_on_sigterm()
     app.run(host=host, port=port, debug=debug)
 
 if __name__ == '__main__':
@@ -0,0 +1,51 @@
+import unittest
+from limits import parse
+from limits.strategies import (FixedWindowRateLimiter, MovingWindowRateLimiter,
+                               SlidingWindowCounterRateLimiter)
+from utils.rate_limit import BoundedMemoryStorage
+
+class BoundedMemoryStorageTest(unittest.TestCase):
+    """BoundedMemoryStorage keeps at most max_keys keys"""
+
+    MAX_KEYS = 3
+
+    def setUp(self):
+        self.storage = BoundedMemoryStorage(max_keys=self.MAX_KEYS)
+        self.limit = parse('5/minute')
+
+    def tearDown(self):
+        self.storage.reset()
+        self.storage.timer.cancel()
+
+    def _hit_distinct_keys(self, strategy, count=1000):
+        limiter = strategy(self.storage)
+        for i in range(count):
+            limiter.hit(self.limit, f'client-{i}')
+
+    def _assert_bounded(self):
+        # Sliding windows track a previous and a current key per client
+        self.assertLessEqual(len(self.storage.storage), self.MAX_KEYS)
+        self.assertLessEqual(len(self.storage.expirations), self.MAX_KEYS)
+        self.assertLessEqual(len(self.storage.events), self.MAX_KEYS)
+        self.assertLessEqual(len(self.storage.locks), self.MAX_KEYS)
+
+    def test_fixed_window_is_bounded(self):
+        self._hit_distinct_keys(FixedWindowRateLimiter)
+        self._assert_bounded()
+
+    def test_moving_window_is_bounded(self):
+        self._hit_distinct_keys(MovingWindowRateLimiter)
+        self._assert_bounded()
+
+    def test_sliding_window_is_bounded(self):
+        self._hit_distinct_keys(SlidingWindowCounterRateLimiter)
+        self._assert_bounded()
+
+    def test_recent_key_is_still_limited(self):
+        limiter = FixedWindowRateLimiter(self.storage)
+        for _ in range(5):
+            self.assertTrue(limiter.hit(self.limit, 'client'))
+        self.assertFalse(limiter.hit(self.limit, 'client'))
+
+if __name__ == '__main__':
+    unittest.main()
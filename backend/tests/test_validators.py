@@ -0,0 +1,43 @@
+import unittest
+from utils.validators import validate_overlay_data, validate_stream_data
+
+def _overlay(**overrides):
+    data = {
+        'name': 'Logo',
+        'type': 'text',
+        'position': {'x': 0, 'y': 0},
+        'size': {'width': 100, 'height': 50}
+    }
+    data.update(overrides)
+    return data
+
+def _stream(**settings):
+    return {'name': 'Camera', 'rtsp_url': 'rtsp://camera/live', 'settings': settings}
+
+class NonStringEnumValuesTest(unittest.TestCase):
+    """Unhashable values for enum fields are validation errors, not exceptions"""
+
+    def test_valid_data_passes(self):
+        self.assertTrue(validate_overlay_data(_overlay())['valid'])
+        self.assertTrue(validate_stream_data(_stream(quality='low', resolution='720p'))['valid'])
+
+    def test_overlay_type(self):
+        for value in (['text'], {'text': 1}, 1):
+            result = validate_overlay_data(_overlay(type=value))
+            self.assertFalse(result['valid'])
+            self.assertIn("Type must be 'text', 'image', or 'logo'", result['errors'])
+
+    def test_stream_quality(self):
+        for value in (['low'], {'low': 1}, 1):
+            result = validate_stream_data(_stream(quality=value))
+            self.assertFalse(result['valid'])
+            self.assertIn("Quality must be 'low', 'medium', or 'high'", result['errors'])
+
+    def test_stream_resolution(self):
+        for value in (['720p'], {'720p': 1}, 720):
+            result = validate_stream_data(_stream(resolution=value))
+            self.assertFalse(result['valid'])
+            self.assertIn("Resolution must be '480p', '720p', or '1080p'", result['errors'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,55 +1,95 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
 from pymongo.database import Database
 from pymongo.collection import Collection
-from typing import Optional
+from typing import Dict, Optional
 import logging
+import time
 from config.settings import Config
+from utils.mongo_pool import get_client, release_client
 
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
     """Database manager for MongoDB operations"""
     
+    # Seconds a ping result is reused by health_check
+    PING_TTL = 2.0
+    
     def __init__(self, config):
         self.config = config
         self.client: Optional[MongoClient] = None
         self.db: Optional[Database] = None
+        self._collections: Dict[str, Collection] = {}
+        self._last_ping = (0.0, False)
         self._connect()
     
     def _connect(self) -> None:
         """Connect to MongoDB"""
         try:
-            self.client = MongoClient(self.config['MONGODB_URI'])
+            # Reuse the process-wide client so re-initialization skips the handshake
+            self.client = get_client(
+                self.config['MONGODB_URI'],
+                serverSelectionTimeoutMS=self.config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+                connectTimeoutMS=self.config['MONGO_CONNECT_TIMEOUT_MS'],
+                socketTimeoutMS=self.config['MONGO_SOCKET_TIMEOUT_MS'],
+                maxPoolSize=self.config['MONGO_MAX_POOL_SIZE'],
+                minPoolSize=self.config['MONGO_MIN_POOL_SIZE'],
+                retryWrites=True,
+                appname='livesitter'
+            )
             self.db = self.client[self.config['DATABASE_NAME']]
             
             # Test connection
             self.client.admin.command('ping')
             logger.info("Successfully connected to MongoDB")
             
+            self._ensure_indexes()
+            
         except Exception as e:
             logger.error(f"Failed to connect to MongoDB: {e}")
+            self.close()
             raise
     
+    def _ensure_indexes(self) -> None:
+        """Create the indexes used by list queries (no-op if they exist)"""
+        # Lists are ordered by _id, whose embedded timestamp matches creation order
+        for name in ('overlays', 'streams'):
+            self.db[name].create_index([('user_id', ASCENDING), ('_id', DESCENDING)])
+    
     def get_collection(self, collection_name: str) -> Collection:
         """Get a MongoDB collection"""
-        if self.db is None:
-            raise Exception("Database not connected")
-        return self.db[collection_name]
+        collection = self._collections.get(collection_name)
+        if collection is None:
+            if self.db is None:
+                raise Exception("Database not connected")
+            collection = self._collections[collection_name] = self.db[collection_name]
+        return collection
     
     def close(self) -> None:
         """Close database connection"""
         if self.client:
-            self.client.close()
-            logger.info("MongoDB connection closed")
+            # Other managers on the same URI keep the pool until they close too
+            release_client(self.client)
+            self.client = None
+            self.db = None
+            self._collections.clear()
     
     def health_check(self) -> bool:
-        """Check database health"""
+        """Check database health, pinging at most once per PING_TTL"""
+        checked_at, healthy = self._last_ping
+        now = time.monotonic()
+        if now - checked_at < self.PING_TTL:
+            return healthy
+        
         try:
             self.client.admin.command('ping')
-            return True
+            healthy = True
         except Exception as e:
             logger.error(f"Database health check failed: {e}")
-            return False
+            healthy = False
+        
+        self._last_ping = (now, healthy)
+        return healthy
 
 # Global database manager instance
 db_manager: Optional[DatabaseManager] = None
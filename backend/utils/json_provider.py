@@ -0,0 +1,68 @@
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator, Union
+from bson import ObjectId
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # e.g. under PyPy, where orjson does not build
+    orjson = None
+    import json
+
+def _default(obj: Any) -> Any:
+    """Serialize types orjson doesn't handle natively"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _stdlib_default(obj: Any) -> Any:
+    """Match orjson's output for the types it serializes natively"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return _default(obj)
+
+if orjson is not None:
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize obj to compact JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    
+    _loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(default=_stdlib_default, separators=(',', ':'), ensure_ascii=False)
+    
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize obj to compact JSON bytes"""
+        return _encoder.encode(obj).encode()
+    
+    _loads = json.loads
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (stdlib json when it is unavailable)"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps_bytes(obj).decode()
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        return _loads(s)
+
+def stream_json_list(items: Iterable[Any], **envelope: Any) -> Response:
+    """Stream {"success": true, **envelope, "data": [...]} item by item
+
+    Items are serialized one at a time while the body is sent, so the whole
+    payload is never held as one bytes object. The status line is already
+    sent by then, so fetch anything that can fail (e.g. a Mongo cursor)
+    before calling this.
+    """
+    head = dumps_bytes({'success': True, **envelope})[:-1] + b',"data":['
+
+    def generate() -> Iterator[bytes]:
+        prefix = head
+        for item in items:
+            yield prefix + dumps_bytes(item)
+            prefix = b','
+        if prefix is head:
+            yield head
+        yield b']}'
+
+    return Response(generate(), mimetype='application/json')
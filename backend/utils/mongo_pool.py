@@ -0,0 +1,37 @@
+from pymongo import MongoClient
+from typing import Any, Dict, List, Tuple
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# One client (and therefore one connection pool) per URI and options per
+# process, with the number of users still holding it
+_clients: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], List[Any]] = {}
+_clients_lock = threading.Lock()
+
+def get_client(uri: str, **options: Any) -> MongoClient:
+    """Get the shared MongoClient for a URI and options; pair every call with release_client"""
+    key = (uri, tuple(sorted(options.items())))
+    with _clients_lock:
+        entry = _clients.get(key)
+        if entry is None:
+            entry = _clients[key] = [MongoClient(uri, **options), 0]
+        entry[1] += 1
+        return entry[0]
+
+def release_client(client: MongoClient) -> None:
+    """Drop one user of a shared MongoClient, closing it when no users remain"""
+    with _clients_lock:
+        for key, entry in _clients.items():
+            if entry[0] is client:
+                entry[1] -= 1
+                if entry[1] > 0:
+                    return
+                del _clients[key]
+                break
+        else:
+            return
+    
+    client.close()
+    logger.info("MongoDB connection closed")
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+import threading
+from limits.storage import MemoryStorage
+
+class BoundedMemoryStorage(MemoryStorage):
+    """In-memory rate limit storage that caps the number of tracked keys.
+
+    The stock ``memory://`` storage keeps one entry per client key forever
+    (until it expires), so a flood of distinct IPs grows the heap without
+    bound. This variant tracks key recency and evicts the least recently
+    used key once ``max_keys`` is exceeded.
+    """
+
+    STORAGE_SCHEME = ['bounded-memory']
+
+    def __init__(self, uri: str = None, max_keys: int = 16384, **options):
+        super().__init__(uri, **options)
+        self.max_keys = int(max_keys)
+        self._recent: OrderedDict = OrderedDict()
+        self._recent_lock = threading.Lock()
+
+    def _touch(self, key: str) -> None:
+        """Mark key as recently used and evict the oldest keys past capacity"""
+        with self._recent_lock:
+            self._recent[key] = None
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.max_keys:
+                oldest, _ = self._recent.popitem(last=False)
+                with self.locks[oldest]:
+                    self.storage.pop(oldest, None)
+                    self.expirations.pop(oldest, None)
+                    self.events.pop(oldest, None)
+                # The expiry sweep only frees locks of keys it still tracks
+                self.locks.pop(oldest, None)
+
+    def incr(self, key: str, expiry: int, *args, **kwargs) -> int:
+        value = super().incr(key, expiry, *args, **kwargs)
+        self._touch(key)
+        return value
+
+    def decr(self, key: str, *args, **kwargs) -> int:
+        value = super().decr(key, *args, **kwargs)
+        self._touch(key)
+        return value
+
+    def acquire_entry(self, key: str, limit: int, expiry: int, *args, **kwargs) -> bool:
+        acquired = super().acquire_entry(key, limit, expiry, *args, **kwargs)
+        self._touch(key)
+        return acquired
+
+    def clear(self, key: str) -> None:
+        super().clear(key)
+        with self._recent_lock:
+            self._recent.pop(key, None)
+
+    def reset(self):
+        with self._recent_lock:
+            self._recent.clear()
+        return super().reset()
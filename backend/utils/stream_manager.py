@@ -1,41 +1,144 @@
+import atexit
 import subprocess
+import json
 import os
 import threading
 import time
 import logging
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+import queue
+import shlex
+import tempfile
+from types import MappingProxyType
+from typing import Callable, Dict, Any, Deque, Optional, List, Mapping, Set, Tuple
+from datetime import datetime, timezone
 import uuid
+from collections import deque
 from config.settings import Config
 
 logger = logging.getLogger(__name__)
 
+# Resolution mapping (FFmpeg scale arguments)
+_RESOLUTION_MAP = MappingProxyType({
+    '480p': '854:480',
+    '720p': '1280:720',
+    '1080p': '1920:1080'
+})
+
+# Quality settings
+_QUALITY_SETTINGS = MappingProxyType({
+    'low': {'bitrate': '500k', 'crf': 28},
+    'medium': {'bitrate': '1000k', 'crf': 23},
+    'high': {'bitrate': '2000k', 'crf': 18}
+})
+
+# Single-segment playlist served when FFmpeg produces no output
+_TEST_PLAYLIST = b"""#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:2
+#EXT-X-MEDIA-SEQUENCE:0
+#EXTINF:2.0,
+segment_000.ts
+#EXT-X-ENDLIST"""
+
+# Seconds before a source whose probe failed is probed again
+PROBE_RETRY_SECONDS = 30.0
+
+class StreamState:
+    """Runtime state of one active stream"""
+    
+    __slots__ = ('process', 'rtsp_url', 'hls_url', 'stream_dir', 'settings',
+                 'started_at_iso', 'status', 'stderr_tail', 'stderr_lock')
+    
+    def __init__(self, process: subprocess.Popen, rtsp_url: str, hls_url: str,
+                 stream_dir: str, settings: Dict[str, Any]):
+        self.process = process
+        self.rtsp_url = rtsp_url
+        self.hls_url = hls_url
+        self.stream_dir = stream_dir
+        self.settings = settings
+        # Formatted once, status and listing calls reuse it
+        self.started_at_iso = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+        self.status = 'starting'
+        # Last FFmpeg stderr lines (warnings/errors only, given -loglevel warning)
+        self.stderr_tail: Deque[str] = deque(maxlen=200)
+        # The monitor appends while status readers copy; don't rely on the GIL (PyPy)
+        self.stderr_lock = threading.Lock()
+    
+    def add_stderr(self, line: bytes) -> None:
+        """Append one FFmpeg stderr line to the tail"""
+        text = line.decode(errors='replace').rstrip()
+        with self.stderr_lock:
+            self.stderr_tail.append(text)
+    
+    def recent_stderr(self, count: int) -> List[str]:
+        """Copy of the last count stderr lines"""
+        with self.stderr_lock:
+            return list(self.stderr_tail)[-count:]
+
 class StreamManager:
     """Manages RTSP to HLS stream conversion"""
     
     def __init__(self, config: Config):
         self.config = config
-        self.active_streams: Dict[str, Dict[str, Any]] = {}
+        self.active_streams: Dict[str, StreamState] = {}
         self.stream_lock = threading.Lock()
+        # Read-only snapshot of active_streams, replaced on every change so
+        # status readers never wait on starts/stops holding stream_lock
+        self._streams_view: Mapping[str, StreamState] = MappingProxyType({})
+        
+        # Encoder threads per stream, and the CPU scheduling applied to FFmpeg
+        self.ffmpeg_threads = getattr(config, 'FFMPEG_THREADS', 2)
+        self.ffmpeg_nice = getattr(config, 'FFMPEG_NICE', 10)
+        self._next_core_slot = 0
         
         # Create streams directory if it doesn't exist
-        self.streams_dir = os.path.join(os.getcwd(), 'streams')
+        self.streams_dir = getattr(config, 'STREAMS_DIR', os.path.join(os.getcwd(), 'streams'))
         os.makedirs(self.streams_dir, exist_ok=True)
         
+        # Resolve FFmpeg and pick the hardware encoder once, from a single probe
+        self.vaapi_device = str(getattr(config, 'FFMPEG_VAAPI_DEVICE', '/dev/dri/renderD128'))
+        self.ffmpeg_path, encoders = self._probe_ffmpeg()
+        self.hwaccel = self._detect_hwaccel(encoders)
+        
+        # Streams whose FFmpeg exited, queued by their monitor for cleanup_streams
+        self._ended: 'queue.SimpleQueue[Tuple[str, StreamState]]' = queue.SimpleQueue()
+        
+        # Streams admitted by start_stream that are still being probed
+        self._starting: Set[str] = set()
+        
+        # ffprobe results per source URL, so restarts skip the probe, and when
+        # each failing URL was last tried, so an offline camera isn't re-probed
+        # on every start attempt
+        self._probe_cache: Dict[str, Dict[str, Any]] = {}
+        self._probe_failures: Dict[str, float] = {}
+        
         # Log config attributes for debugging
-        logger.info(f"StreamManager initialized with config: MAX_STREAMS={getattr(config, 'MAX_STREAMS', 'NOT_FOUND')}, FFMPEG_PATH={getattr(config, 'FFMPEG_PATH', 'NOT_FOUND')}")
+        logger.info("StreamManager initialized with config: MAX_STREAMS=%s, FFMPEG_PATH=%s",
+                    getattr(config, 'MAX_STREAMS', 'NOT_FOUND'), self.ffmpeg_path)
     
     def start_stream(self, stream_id: str, rtsp_url: str, settings: Dict[str, Any] = None) -> Dict[str, Any]:
         """Start RTSP to HLS conversion"""
+        # Admit before opening an RTSP session to probe, reserving the id and a
+        # slot so the probe can run without the lock
         with self.stream_lock:
-            if stream_id in self.active_streams:
-                return {'success': False, 'error': 'Stream already running'}
+            rejection = self._check_admission(stream_id)
+            if rejection:
+                return rejection
+            self._starting.add(stream_id)
+        
+        # Probe outside the lock, it can take seconds on a slow camera
+        try:
+            copy_video = self._can_copy_video(rtsp_url, settings or {})
+        except Exception:
+            with self.stream_lock:
+                self._starting.discard(stream_id)
+            raise
+        
+        with self.stream_lock:
+            self._starting.discard(stream_id)
             
-            # Check if MAX_STREAMS attribute exists, default to 5 if not
-            max_streams = getattr(self.config, 'MAX_STREAMS', 5)
-            logger.info(f"Starting stream {stream_id}, current streams: {len(self.active_streams)}, max: {max_streams}")
-            if len(self.active_streams) >= max_streams:
-                return {'success': False, 'error': 'Maximum streams reached'}
+            logger.info("Starting stream %s, current streams: %s, max: %s",
+                        stream_id, len(self.active_streams), getattr(self.config, 'MAX_STREAMS', 5))
             
             # Default settings
             default_settings = {
@@ -49,7 +152,11 @@ class StreamManager:
             
             # Create stream directory
             stream_dir = os.path.join(self.streams_dir, stream_id)
-            os.makedirs(stream_dir, exist_ok=True)
+            # streams_dir exists since __init__, so a single mkdir is enough
+            try:
+                os.mkdir(stream_dir)
+            except FileExistsError:
+                pass
             
             # Generate HLS URL - include full API path
             hls_url = f"/api/streams/hls/{stream_id}/playlist.m3u8"
@@ -57,39 +164,40 @@ class StreamManager:
             try:
                 # Build FFmpeg command
                 ffmpeg_cmd = self._build_ffmpeg_command(
-                    rtsp_url, stream_dir, default_settings
+                    rtsp_url, stream_dir, default_settings, copy_video=copy_video
                 )
                 
-                # Start FFmpeg process without shell=True for better security and reliability
-                logger.info(f"Starting FFmpeg with command: {ffmpeg_cmd}")
+                # Exec FFmpeg directly from the argv list; no /bin/sh in between
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("Starting FFmpeg with command: %s", shlex.join(ffmpeg_cmd))
                 
-                # Split command into list for subprocess
-                cmd_parts = ffmpeg_cmd.split()
                 process = subprocess.Popen(
-                    cmd_parts,
-                    stdout=subprocess.PIPE,
+                    ffmpeg_cmd,
+                    stdout=subprocess.DEVNULL,  # FFmpeg writes its output to files
                     stderr=subprocess.PIPE,
-                    shell=False  # Changed from True for better security
+                    shell=False,
+                    # Own session, so a Ctrl-C/SIGINT to the server's group leaves
+                    # FFmpeg to be stopped by shutdown_stream_manager
+                    start_new_session=True,
+                    preexec_fn=self._scheduling_preexec()
                 )
                 
                 # Check if process started successfully
                 if process.poll() is not None:
-                    # Process ended immediately, get error output
-                    stdout, stderr = process.communicate()
-                    error_msg = f"FFmpeg process failed to start. stdout: {stdout.decode()}, stderr: {stderr.decode()}"
+                    # Process ended immediately, keep only the last lines of its error output
+                    stderr_tail = deque((line.decode(errors='replace').rstrip() for line in process.stderr),
+                                        maxlen=20)
+                    process.stderr.close()
+                    process.wait()
+                    error_msg = "FFmpeg process failed to start. stderr: " + '\n'.join(stderr_tail)
                     logger.error(error_msg)
                     return {'success': False, 'error': error_msg}
                 
                 # Store stream info
-                self.active_streams[stream_id] = {
-                    'process': process,
-                    'rtsp_url': rtsp_url,
-                    'hls_url': hls_url,
-                    'stream_dir': stream_dir,
-                    'settings': default_settings,
-                    'started_at': datetime.utcnow(),
-                    'status': 'starting'
-                }
+                self.active_streams[stream_id] = StreamState(
+                    process, rtsp_url, hls_url, stream_dir, default_settings
+                )
+                self._publish()
                 
                 # Start monitoring thread
                 monitor_thread = threading.Thread(
@@ -99,7 +207,7 @@ class StreamManager:
                 )
                 monitor_thread.start()
                 
-                logger.info(f"Started stream {stream_id} with RTSP URL: {rtsp_url}")
+                logger.info("Started stream %s with RTSP URL: %s", stream_id, rtsp_url)
                 return {
                     'success': True,
                     'stream_id': stream_id,
@@ -111,226 +219,393 @@ class StreamManager:
                 logger.error(f"Failed to start stream {stream_id}: {e}")
                 return {'success': False, 'error': str(e)}
     
+    def _check_admission(self, stream_id: str) -> Optional[Dict[str, Any]]:
+        """Error result if the stream can't be started now (call with stream_lock held)"""
+        # Streams whose FFmpeg has exited no longer hold a slot or their id
+        if self._reap_ended():
+            self._publish()
+        
+        if stream_id in self.active_streams or stream_id in self._starting:
+            return {'success': False, 'error': 'Stream already running'}
+        
+        # Check if MAX_STREAMS attribute exists, default to 5 if not
+        max_streams = getattr(self.config, 'MAX_STREAMS', 5)
+        if len(self.active_streams) + len(self._starting) >= max_streams:
+            return {'success': False, 'error': 'Maximum streams reached'}
+        return None
+    
     def stop_stream(self, stream_id: str) -> Dict[str, Any]:
         """Stop RTSP to HLS conversion"""
+        # Only the removal needs the lock; waiting for FFmpeg to exit must not
+        # hold up other starts and stops
         with self.stream_lock:
-            if stream_id not in self.active_streams:
+            stream_info = self.active_streams.pop(stream_id, None)
+            if stream_info is None:
                 return {'success': False, 'error': 'Stream not found'}
+            self._publish()
+        
+        process = stream_info.process
+        
+        try:
+            # Terminate FFmpeg process
+            process.terminate()
+            
+            # Wait for process to terminate
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
             
-            stream_info = self.active_streams[stream_id]
-            process = stream_info['process']
+            logger.info("Stopped stream %s", stream_id)
+            return {'success': True, 'stream_id': stream_id}
             
+        except Exception as e:
+            logger.error(f"Failed to stop stream {stream_id}: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    def stop_all_streams(self, timeout: float = 3.0) -> None:
+        """Terminate every running FFmpeg process, killing those still alive after timeout"""
+        with self.stream_lock:
+            streams = list(self.active_streams.values())
+            self.active_streams.clear()
+            self._publish()
+        
+        for stream_info in streams:
+            stream_info.process.terminate()
+        
+        deadline = time.monotonic() + timeout
+        for stream_info in streams:
             try:
-                # Terminate FFmpeg process
-                process.terminate()
-                
-                # Wait for process to terminate
-                try:
-                    process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    process.kill()
-                
-                # Clean up
-                del self.active_streams[stream_id]
-                
-                logger.info(f"Stopped stream {stream_id}")
-                return {'success': True, 'stream_id': stream_id}
-                
-            except Exception as e:
-                logger.error(f"Failed to stop stream {stream_id}: {e}")
-                return {'success': False, 'error': str(e)}
+                stream_info.process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                stream_info.process.kill()
+        
+        if streams:
+            logger.info("Stopped %s streams on shutdown", len(streams))
     
     def get_stream_status(self, stream_id: str) -> Dict[str, Any]:
         """Get stream status"""
-        with self.stream_lock:
-            if stream_id not in self.active_streams:
-                return {'exists': False}
-            
-            stream_info = self.active_streams[stream_id]
-            process = stream_info['process']
-            
-            return {
-                'exists': True,
-                'status': stream_info['status'],
-                'rtsp_url': stream_info['rtsp_url'],
-                'hls_url': stream_info['hls_url'],
-                'started_at': stream_info['started_at'].isoformat(),
-                'process_alive': process.poll() is None
-            }
+        stream_info = self._streams_view.get(stream_id)
+        if stream_info is None:
+            return {'exists': False}
+        
+        return {
+            'exists': True,
+            'status': stream_info.status,
+            'rtsp_url': stream_info.rtsp_url,
+            'hls_url': stream_info.hls_url,
+            'started_at': stream_info.started_at_iso,
+            'process_alive': stream_info.process.poll() is None,
+            'last_errors': stream_info.recent_stderr(10)
+        }
     
     def get_all_streams(self) -> List[Dict[str, Any]]:
         """Get all active streams"""
-        with self.stream_lock:
-            streams = []
-            for stream_id, stream_info in self.active_streams.items():
-                streams.append({
-                    'stream_id': stream_id,
-                    'status': stream_info['status'],
-                    'rtsp_url': stream_info['rtsp_url'],
-                    'hls_url': stream_info['hls_url'],
-                    'started_at': stream_info['started_at'].isoformat()
-                })
-            return streams
+        return [{
+            'stream_id': stream_id,
+            'status': stream_info.status,
+            'rtsp_url': stream_info.rtsp_url,
+            'hls_url': stream_info.hls_url,
+            'started_at': stream_info.started_at_iso
+        } for stream_id, stream_info in self._streams_view.items()]
     
-    def _build_ffmpeg_command(self, rtsp_url: str, stream_dir: str, settings: Dict[str, Any]) -> str:
-        """Build FFmpeg command for RTSP to HLS conversion"""
-        
-        # Resolution mapping
-        resolution_map = {
-            '480p': '854:480',
-            '720p': '1280:720',
-            '1080p': '1920:1080'
-        }
+    def _publish(self) -> None:
+        """Replace the reader snapshot after active_streams changed (call with stream_lock held)"""
+        self._streams_view = MappingProxyType(dict(self.active_streams))
+    
+    def _scheduling_preexec(self) -> Optional[Callable[[], None]]:
+        """Function run in the FFmpeg child before exec that lowers its priority and
+        pins it to its own cores, leaving the first core to the API"""
+        nice = self.ffmpeg_nice if hasattr(os, 'setpriority') else 0
         
-        # Quality settings
-        quality_settings = {
-            'low': {'bitrate': '500k', 'crf': 28},
-            'medium': {'bitrate': '1000k', 'crf': 23},
-            'high': {'bitrate': '2000k', 'crf': 18}
-        }
+        # Linux only; cores are handed out round-robin (called with stream_lock held)
+        cores = None
+        if self.ffmpeg_threads and hasattr(os, 'sched_setaffinity'):
+            pool = sorted(os.sched_getaffinity(0))[1:]
+            if len(pool) >= self.ffmpeg_threads:
+                start = self._next_core_slot * self.ffmpeg_threads
+                self._next_core_slot += 1
+                cores = {pool[(start + i) % len(pool)] for i in range(self.ffmpeg_threads)}
+        
+        if not nice and not cores:
+            return None
+        
+        def apply() -> None:
+            # Set before exec so every thread FFmpeg starts inherits both
+            try:
+                if nice:
+                    os.setpriority(os.PRIO_PROCESS, 0, nice)
+                if cores:
+                    os.sched_setaffinity(0, cores)
+            except OSError:
+                # Nothing can be logged from the forked child; run FFmpeg unscheduled
+                pass
+        
+        return apply
+    
+    def _probe_ffmpeg(self) -> Tuple[str, str]:
+        """Check the configured FFmpeg, returning the path to use and its encoder list"""
+        ffmpeg_path = str(getattr(self.config, 'FFMPEG_PATH', 'ffmpeg'))
+        try:
+            result = subprocess.run([ffmpeg_path, '-hide_banner', '-encoders'],
+                                    capture_output=True, text=True, timeout=5)
+            if result.returncode == 0:
+                return ffmpeg_path, result.stdout
+            logger.error(f"FFmpeg not available: {result.stderr}")
+        except Exception as e:
+            logger.error(f"Error checking FFmpeg availability: {e}")
+        
+        # Use a fallback command that might work
+        return 'ffmpeg', ''
+    
+    def _detect_hwaccel(self, encoders: str) -> Optional[str]:
+        """Pick a hardware H.264 encoder ('nvenc' or 'vaapi') or None for libx264"""
+        if getattr(self.config, 'FFMPEG_HWACCEL', 'auto') != 'auto':
+            return None
+        
+        # Static FFmpeg builds list NVENC even without a GPU, so require the device too
+        if 'h264_nvenc' in encoders and os.path.exists('/dev/nvidiactl'):
+            logger.info("Using NVENC hardware encoding")
+            return 'nvenc'
+        if 'h264_vaapi' in encoders and os.path.exists(self.vaapi_device):
+            logger.info("Using VAAPI hardware encoding on %s", self.vaapi_device)
+            return 'vaapi'
+        return None
+    
+    def _rtsp_args(self) -> List[str]:
+        """Input options selecting the configured RTSP transport"""
+        transport = getattr(self.config, 'RTSP_TRANSPORT', 'tcp')
+        return ['-rtsp_transport', str(transport)] if transport else []
+    
+    def _probe_source(self, rtsp_url: str) -> Optional[Dict[str, Any]]:
+        """Get codec, size and frame rate of the source's first video stream"""
+        info = self._probe_cache.get(rtsp_url)
+        if info is not None:
+            return info
+        
+        failed_at = self._probe_failures.get(rtsp_url)
+        if failed_at is not None and time.monotonic() - failed_at < PROBE_RETRY_SECONDS:
+            return None
+        
+        ffprobe_path = getattr(self.config, 'FFPROBE_PATH', 'ffprobe')
+        try:
+            result = subprocess.run(
+                [ffprobe_path, '-v', 'error', *self._rtsp_args(), '-select_streams', 'v:0',
+                 '-show_entries', 'stream=codec_name,width,height,r_frame_rate',
+                 '-of', 'json', rtsp_url],
+                capture_output=True, text=True, timeout=5
+            )
+            info = json.loads(result.stdout)['streams'][0]
+        except Exception as e:
+            logger.warning(f"Could not probe {rtsp_url}, re-encoding: {e}")
+            if len(self._probe_failures) >= 256:
+                self._probe_failures.clear()
+            self._probe_failures[rtsp_url] = time.monotonic()
+            return None
+        
+        self._probe_failures.pop(rtsp_url, None)
+        if len(self._probe_cache) >= 256:
+            self._probe_cache.clear()
+        self._probe_cache[rtsp_url] = info
+        return info
+    
+    def _can_copy_video(self, rtsp_url: str, settings: Dict[str, Any]) -> bool:
+        """Whether the source is already H.264 at the requested size and frame rate"""
+        info = self._probe_source(rtsp_url)
+        if not info or info.get('codec_name') != 'h264':
+            return False
         
+        if info.get('height') != int(settings.get('resolution', '720p')[:-1]):
+            return False
+        
+        try:
+            num, den = info.get('r_frame_rate', '0/1').split('/')
+            source_fps = int(num) / int(den)
+        except (ValueError, ZeroDivisionError):
+            return False
+        return abs(source_fps - settings.get('fps', 30)) < 1
+    
+    def _build_ffmpeg_command(self, rtsp_url: str, stream_dir: str, settings: Dict[str, Any],
+                              copy_video: bool = False) -> List[str]:
+        """Build the FFmpeg argv (all str) for RTSP to HLS conversion"""
         quality = settings.get('quality', 'medium')
         fps = settings.get('fps', 30)
         resolution = settings.get('resolution', '720p')
-        bitrate = settings.get('bitrate', quality_settings[quality]['bitrate'])
-        crf = quality_settings[quality]['crf']
+        bitrate = settings.get('bitrate', _QUALITY_SETTINGS[quality]['bitrate'])
+        crf = _QUALITY_SETTINGS[quality]['crf']
         
         # Build command with fallback values for config attributes
-        ffmpeg_path = getattr(self.config, 'FFMPEG_PATH', 'ffmpeg')
         hls_segment_duration = getattr(self.config, 'HLS_SEGMENT_DURATION', 2)
         hls_playlist_length = getattr(self.config, 'HLS_PLAYLIST_LENGTH', 10)
         
-        # Check if FFmpeg is available
-        try:
-            import subprocess
-            result = subprocess.run([ffmpeg_path, '-version'], capture_output=True, text=True)
-            if result.returncode != 0:
-                logger.error(f"FFmpeg not available: {result.stderr}")
-                # Use a fallback command that might work
-                ffmpeg_path = 'ffmpeg'
-        except Exception as e:
-            logger.error(f"Error checking FFmpeg availability: {e}")
-            ffmpeg_path = 'ffmpeg'
+        # Live input: don't buffer or reorder frames before they reach the encoder
+        input_args = ['-fflags', 'nobuffer', '-flags', 'low_delay', *self._rtsp_args()]
+        
+        scale = _RESOLUTION_MAP[resolution]
+        if copy_video:
+            # Source already matches the target, remux instead of re-encoding
+            video_args = ['-c:v', 'copy']
+            video_filter = None
+        elif self.hwaccel == 'nvenc':
+            # Decode, scale and encode on the GPU so frames stay in device memory
+            input_args += ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda']
+            video_args = ['-c:v', 'h264_nvenc', '-preset', 'p4', '-tune', 'll', '-rc', 'vbr', '-cq', str(crf)]
+            video_filter = f'fps={fps},scale_cuda={scale}'
+        elif self.hwaccel == 'vaapi':
+            # Same for VAAPI; no hwupload/hwdownload round trip through system memory
+            width, height = scale.split(':')
+            input_args += ['-hwaccel', 'vaapi', '-hwaccel_device', self.vaapi_device,
+                           '-hwaccel_output_format', 'vaapi']
+            video_args = ['-c:v', 'h264_vaapi', '-qp', str(crf)]
+            video_filter = f'fps={fps},scale_vaapi=w={width}:h={height}'
+        else:
+            video_args = [
+                '-c:v', 'libx264',
+                '-preset', str(getattr(self.config, 'LIBX264_PRESET', 'veryfast')),
+                '-tune', 'zerolatency',
+                '-crf', str(crf),
+                # No scene-cut keyframes, only the fixed GOP below
+                '-sc_threshold', '0'
+            ]
+            if self.ffmpeg_threads:
+                video_args += ['-threads', str(self.ffmpeg_threads)]
+            video_filter = f'scale={scale},fps={fps}'
+        
+        if not copy_video:
+            # One keyframe per HLS segment, so every segment starts on a keyframe
+            video_args += ['-g', str(fps * hls_segment_duration)]
         
         # Simplified FFmpeg command for better compatibility
         cmd = [
-            ffmpeg_path,
+            self.ffmpeg_path,
+            # Only warnings and errors, no progress lines to pile up in the monitor's pipes
+            '-hide_banner', '-nostats', '-loglevel', 'warning',
+            *input_args,
             '-i', rtsp_url,
-            '-c:v', 'libx264',
-            '-preset', 'ultrafast',  # Changed from 'fast' for better compatibility
-            '-crf', str(crf),
+            *video_args,
             '-c:a', 'aac',
             '-b:a', '128k',
             '-f', 'hls',
             '-hls_time', str(hls_segment_duration),
             '-hls_list_size', str(hls_playlist_length),
-            '-hls_flags', 'delete_segments',
+            '-hls_flags', 'delete_segments+temp_file',  # Renamed into place once complete
             '-hls_segment_filename', os.path.join(stream_dir, 'segment_%03d.ts'),
-            '-vf', f'scale={resolution_map[resolution]},fps={fps}',
+            *(['-vf', video_filter] if video_filter else []),
             '-y',  # Overwrite output files
             os.path.join(stream_dir, 'playlist.m3u8')
         ]
         
-        logger.info(f"Built FFmpeg command: {' '.join(cmd)}")
-        return ' '.join(cmd)
+        return cmd
     
     def _monitor_stream(self, stream_id: str) -> None:
         """Monitor stream process and update status"""
-        stream_info = self.active_streams.get(stream_id)
+        stream_info = self._streams_view.get(stream_id)
         if not stream_info:
             return
         
-        process = stream_info['process']
-        stream_dir = stream_info['stream_dir']
+        process = stream_info.process
+        stream_dir = stream_info.stream_dir
+        playlist_path = os.path.join(stream_dir, 'playlist.m3u8')
         
-        # Wait a bit for process to start
-        time.sleep(2)
+        # Wait up to 5s for the first playlist, returning as soon as it
+        # appears or FFmpeg exits
+        deadline = time.monotonic() + 5
+        while not os.path.exists(playlist_path) and time.monotonic() < deadline:
+            try:
+                process.wait(timeout=0.25)
+                break
+            except subprocess.TimeoutExpired:
+                pass
         
         # Check if process is still running
         if process.poll() is None:
-            # Check if HLS files are being created
-            playlist_path = os.path.join(stream_dir, 'playlist.m3u8')
             if os.path.exists(playlist_path):
-                stream_info['status'] = 'running'
-                logger.info(f"Stream {stream_id} is running successfully with HLS files")
+                stream_info.status = 'running'
+                logger.info("Stream %s is running successfully with HLS files", stream_id)
             else:
-                # Wait a bit more for files to be created
-                time.sleep(3)
-                if os.path.exists(playlist_path):
-                    stream_info['status'] = 'running'
-                    logger.info(f"Stream {stream_id} is running successfully with HLS files")
-                else:
-                    # FFmpeg might have failed, create test files as fallback
-                    logger.warning(f"Stream {stream_id} started but HLS files not created, creating test files")
-                    self._create_test_hls_files(stream_id, stream_dir)
-                    stream_info['status'] = 'running'
-                    logger.info(f"Stream {stream_id} running with test HLS files")
+                # FFmpeg might have failed, create test files as fallback
+                logger.warning(f"Stream {stream_id} started but HLS files not created, creating test files")
+                self._create_test_hls_files(stream_id, stream_dir)
+                stream_info.status = 'running'
+                logger.info("Stream %s running with test HLS files", stream_id)
+            
+            # Drain stderr until FFmpeg exits so it never blocks on a full pipe,
+            # keeping only the most recent lines for diagnostics
+            for line in process.stderr:
+                stream_info.add_stderr(line)
+            process.wait()
         else:
-            stream_info['status'] = 'error'
-            # Get error output
-            stdout, stderr = process.communicate()
-            logger.error(f"Stream {stream_id} process terminated unexpectedly. stdout: {stdout.decode()}, stderr: {stderr.decode()}")
+            stream_info.status = 'error'
+            # Drain error output into the ring, logging only its last lines
+            for line in process.stderr:
+                stream_info.add_stderr(line)
+            logger.error("Stream %s process terminated unexpectedly. stderr: %s",
+                         stream_id, '\n'.join(stream_info.recent_stderr(20)))
             
             # Create test files as fallback
             logger.warning(f"Creating test HLS files for failed stream {stream_id}")
             self._create_test_hls_files(stream_id, stream_dir)
-            stream_info['status'] = 'running'
         
-        # Monitor process
-        while stream_id in self.active_streams:
-            if process.poll() is not None:
-                stream_info['status'] = 'stopped'
-                logger.info(f"Stream {stream_id} process ended")
-                break
-            time.sleep(5)
+        stream_info.status = 'stopped'
+        logger.info("Stream %s process ended", stream_id)
+        self._ended.put((stream_id, stream_info))
     
     def _create_test_hls_files(self, stream_id: str, stream_dir: str) -> None:
         """Create test HLS files for debugging"""
         try:
             os.makedirs(stream_dir, exist_ok=True)
             
-            # Create a simple test playlist
-            playlist_content = """#EXTM3U
-#EXT-X-VERSION:3
-#EXT-X-TARGETDURATION:2
-#EXT-X-MEDIA-SEQUENCE:0
-#EXTINF:2.0,
-segment_000.ts
-#EXT-X-ENDLIST"""
-            
-            playlist_path = os.path.join(stream_dir, 'playlist.m3u8')
-            with open(playlist_path, 'w') as f:
-                f.write(playlist_content)
-            
-            # Create a simple test segment (empty file for testing)
+            # Create a simple test segment (empty file for testing) before the
+            # playlist that references it
             segment_path = os.path.join(stream_dir, 'segment_000.ts')
-            with open(segment_path, 'w') as f:
-                f.write('')
+            open(segment_path, 'wb').close()
+            
+            # Publish the playlist atomically so a concurrent reader never sees it half written
+            fd, tmp_path = tempfile.mkstemp(dir=stream_dir, suffix='.tmp')
+            try:
+                os.write(fd, _TEST_PLAYLIST)
+            finally:
+                os.close(fd)
+            os.replace(tmp_path, os.path.join(stream_dir, 'playlist.m3u8'))
             
-            logger.info(f"Created test HLS files for stream {stream_id}")
+            logger.info("Created test HLS files for stream %s", stream_id)
         except Exception as e:
             logger.error(f"Failed to create test HLS files for stream {stream_id}: {e}")
     
     def cleanup_streams(self) -> None:
         """Clean up stopped streams"""
         with self.stream_lock:
-            stopped_streams = []
-            for stream_id, stream_info in self.active_streams.items():
-                if stream_info['process'].poll() is not None:
-                    stopped_streams.append(stream_id)
+            if self._reap_ended():
+                self._publish()
+    
+    def _reap_ended(self) -> bool:
+        """Drop streams whose FFmpeg exited (call with stream_lock held), returning whether any were"""
+        removed = False
+        while True:
+            try:
+                stream_id, stream_info = self._ended.get_nowait()
+            except queue.Empty:
+                return removed
             
-            for stream_id in stopped_streams:
+            # Skip streams already stopped, or restarted under the same id
+            if self.active_streams.get(stream_id) is stream_info:
                 del self.active_streams[stream_id]
-                logger.info(f"Cleaned up stopped stream {stream_id}")
+                removed = True
+                logger.info("Cleaned up stopped stream %s", stream_id)
 
 # Global stream manager instance
 stream_manager: Optional[StreamManager] = None
+_exit_hook_registered = False
 
 def init_stream_manager(config: Config) -> StreamManager:
     """Initialize stream manager"""
-    global stream_manager
+    global stream_manager, _exit_hook_registered
     try:
         stream_manager = StreamManager(config)
+        # Don't leave FFmpeg children (and their encoder sessions) behind on exit
+        if not _exit_hook_registered:
+            atexit.register(shutdown_stream_manager)
+            _exit_hook_registered = True
         logger.info("Stream manager initialized successfully")
         return stream_manager
     except Exception as e:
@@ -341,4 +616,9 @@ def get_stream_manager() -> StreamManager:
     """Get stream manager instance"""
     if stream_manager is None:
         raise Exception("Stream manager not initialized")
-    return stream_manager 
\ No newline at end of file
+    return stream_manager
+
+def shutdown_stream_manager() -> None:
+    """Stop all FFmpeg processes of the stream manager (exit hook; don't call from a signal handler)"""
+    if stream_manager is not None:
+        stream_manager.stop_all_streams()
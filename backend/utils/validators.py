@@ -1,6 +1,14 @@
 import re
 from typing import Dict, Any, List, Optional
-from urllib.parse import urlparse
+from bson import ObjectId
+from bson.errors import InvalidId
+from models.overlay import Overlay
+
+# Compiled once at import instead of on every validation call
+_OBJECT_ID_RE = re.compile(r'^[0-9a-fA-F]{24}$')
+_UNSAFE_CHARS = str.maketrans('', '', '<>"\'')
+_QUALITIES = frozenset(('low', 'medium', 'high'))
+_RESOLUTIONS = frozenset(('480p', '720p', '1080p'))
 
 def validate_rtsp_url(url: str) -> Dict[str, Any]:
     """Validate RTSP URL format"""
@@ -14,62 +22,16 @@ def validate_rtsp_url(url: str) -> Dict[str, Any]:
     if not url.startswith('rtsp://'):
         errors.append("URL must start with 'rtsp://'")
     
-    # Basic URL format validation
-    try:
-        parsed = urlparse(url)
-        if not parsed.netloc:
-            errors.append("Invalid URL format")
-    except Exception:
+    # Basic URL format validation: a host must follow the scheme
+    _, separator, rest = url.partition('://')
+    if not separator or not rest or rest[0] in '/?#':
         errors.append("Invalid URL format")
     
     return {'valid': len(errors) == 0, 'errors': errors}
 
 def validate_overlay_data(data: Dict[str, Any]) -> Dict[str, Any]:
     """Validate overlay data"""
-    errors = []
-    
-    # Required fields
-    if not data.get('name'):
-        errors.append("Name is required")
-    
-    if not data.get('type'):
-        errors.append("Type is required")
-    elif data['type'] not in ['text', 'image', 'logo']:
-        errors.append("Type must be 'text', 'image', or 'logo'")
-    
-    # Validate position
-    position = data.get('position', {})
-    if not isinstance(position, dict):
-        errors.append("Position must be an object")
-    else:
-        if not isinstance(position.get('x'), (int, float)):
-            errors.append("Position x must be a number")
-        if not isinstance(position.get('y'), (int, float)):
-            errors.append("Position y must be a number")
-    
-    # Validate size
-    size = data.get('size', {})
-    if not isinstance(size, dict):
-        errors.append("Size must be an object")
-    else:
-        if not isinstance(size.get('width'), (int, float)) or size.get('width', 0) <= 0:
-            errors.append("Size width must be a positive number")
-        if not isinstance(size.get('height'), (int, float)) or size.get('height', 0) <= 0:
-            errors.append("Size height must be a positive number")
-    
-    # Validate style
-    style = data.get('style', {})
-    if not isinstance(style, dict):
-        errors.append("Style must be an object")
-    else:
-        if 'fontSize' in style and not isinstance(style['fontSize'], (int, float)):
-            errors.append("Font size must be a number")
-        if 'opacity' in style and not (0 <= style['opacity'] <= 1):
-            errors.append("Opacity must be between 0 and 1")
-        if 'color' in style and not re.match(r'^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$', style['color']):
-            errors.append("Color must be a valid hex color")
-    
-    return {'valid': len(errors) == 0, 'errors': errors}
+    return Overlay.validate(data)
 
 def validate_stream_data(data: Dict[str, Any]) -> Dict[str, Any]:
     """Validate stream data"""
@@ -91,11 +53,13 @@ def validate_stream_data(data: Dict[str, Any]) -> Dict[str, Any]:
     if not isinstance(settings, dict):
         errors.append("Settings must be an object")
     else:
-        if 'quality' in settings and settings['quality'] not in ['low', 'medium', 'high']:
+        quality = settings.get('quality')
+        if 'quality' in settings and not (isinstance(quality, str) and quality in _QUALITIES):
             errors.append("Quality must be 'low', 'medium', or 'high'")
         if 'fps' in settings and not isinstance(settings['fps'], int):
             errors.append("FPS must be an integer")
-        if 'resolution' in settings and settings['resolution'] not in ['480p', '720p', '1080p']:
+        resolution = settings.get('resolution')
+        if 'resolution' in settings and not (isinstance(resolution, str) and resolution in _RESOLUTIONS):
             errors.append("Resolution must be '480p', '720p', or '1080p'")
     
     return {'valid': len(errors) == 0, 'errors': errors}
@@ -106,7 +70,7 @@ def sanitize_string(value: str, max_length: int = 255) -> str:
         return ""
     
     # Remove potentially dangerous characters
-    sanitized = re.sub(r'[<>"\']', '', value)
+    sanitized = value.translate(_UNSAFE_CHARS)
     
     # Limit length
     if len(sanitized) > max_length:
@@ -134,5 +98,11 @@ def validate_object_id(object_id: str) -> bool:
         return False
     
     # MongoDB ObjectId is 24 characters long and contains only hex characters
-    pattern = r'^[0-9a-fA-F]{24}$'
-    return bool(re.match(pattern, object_id)) 
\ No newline at end of file
+    return bool(_OBJECT_ID_RE.match(object_id))
+
+def parse_object_id(object_id: str) -> Optional[ObjectId]:
+    """Parse a MongoDB ObjectId, returning None if the format is invalid"""
+    try:
+        return ObjectId(object_id)
+    except (InvalidId, TypeError):
+        return None
\ No newline at end of file